@@ -18,8 +18,16 @@ from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
 import os
+import re
 import sys
+import json
+import hashlib
 import time
+import queue
+import struct
+import threading
+import collections
+import concurrent.futures
 import serial
 from serial.tools import list_ports
 import random
@@ -40,6 +48,10 @@ line = " "
 draw = " "
 serial_on = 0
 LARGE_FONT = ("Verdana", 12)
+LIVE_HISTORY = 100000 # najvec shranjenih vzorcev za graf v zivo
+LIVE_FPS = 25 # ciljna hitrost osvezevanja grafa v zivo
+DRAW_BATCH_SIZE = 64 # najvec vzorcev v enem paketu iz PortReader
+DRAW_MAX_LATENCY = 0.05 # najdlje cakanje na poln paket [s]
 
 
 class MainWindow(QMainWindow):
@@ -60,11 +72,14 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Programmable optic sensor GUI 0.9.1")
         self.setWindowIcon(QIcon('icons/logo.png'))
 
+        port_registry.start()
+
     def closeEvent(self, event):
         quit_question = QMessageBox.question(self, "Confirm exit", "Exit application?",
                                              QMessageBox.Yes | QMessageBox.No)
 
         if quit_question == QMessageBox.Yes:
+            port_registry.stop()
             event.accept()
 
         else:
@@ -82,10 +97,12 @@ class MainWindow(QMainWindow):
         # Tools
         tools_menu = menu_bar.addMenu('&Tools')
         tools_menu.addAction(self.config_act)
+        tools_menu.addAction(self.fleet_act)
         tools_menu.addAction(self.calibrate_act)
         tools_menu.addAction(self.display_graph_act)
         tools_menu.addAction(self.log_plotter_act)
         tools_menu.addAction(self.log_editor_act)
+        tools_menu.addAction(self.convert_log_act)
         tools_menu.addAction(self.debug_act)
 
         # Help
@@ -126,6 +143,11 @@ class MainWindow(QMainWindow):
         self.config_act.setStatusTip('Config sensor')
         self.config_act.triggered.connect(self.config_sensor)
 
+        # Icon made by[Gregor Cresnar in Tools and utensils] from www.flaticon.com
+        self.fleet_act = QAction(QIcon('icons/settings.png'), '&Fleet programming', self)
+        self.fleet_act.setStatusTip('Program many sensors at once')
+        self.fleet_act.triggered.connect(self.fleet_programming)
+
         # Icon made by[Freepik in business] from www.flaticon.com
         self.display_graph_act = QAction(QIcon('icons/icon.png'), '&Display graph', self)
         self.display_graph_act.setStatusTip('Display graph')
@@ -141,6 +163,11 @@ class MainWindow(QMainWindow):
         self.log_editor_act.setStatusTip('Log plotter')
         self.log_editor_act.triggered.connect(self.log_editor)
 
+        # Icon made by[Freepik in interface] from www.flaticon.com
+        self.convert_log_act = QAction(QIcon('icons/log-file-format-edit.png'), '&Convert log', self)
+        self.convert_log_act.setStatusTip('Convert log between text and binary format')
+        self.convert_log_act.triggered.connect(self.convert_log)
+
         # Icon made by[Freepik in interface] from www.flaticon.com
         self.debug_act = QAction(QIcon('icons/debug.png'), '&Debug console', self)
         self.debug_act.setStatusTip('Debug console')
@@ -174,6 +201,11 @@ class MainWindow(QMainWindow):
 
         self.config_sen.show()
 
+    def fleet_programming(self):
+        self.fleet = FleetWindow()
+        self.mdiArea.addSubWindow(self.fleet)
+        self.fleet.show()
+
     def calibrate_sensor(self):
         self.calibrate = CalibrateSensor()
         self.calibrate.show()
@@ -193,6 +225,36 @@ class MainWindow(QMainWindow):
         self.mdiArea.addSubWindow(self.log_edit)
         self.log_edit.showMaximized()
 
+    def convert_log(self):
+        source = QFileDialog.getOpenFileName(self, "Convert log file", "", "Log files (*.txt *.log *.bin)")[0]
+
+        if source == '':
+            return
+
+        try:
+            if is_binary_log(source):
+                labels = [label for label, style, separator in LOG_STYLES if style != BINARY_LOG]
+                label, ok = QInputDialog.getItem(self, "Convert log", "Text log style:", labels, 0, False)
+                target = QFileDialog.getSaveFileName(self, "Save text log", os.path.splitext(source)[0] + ".txt",
+                                                     "Text files (*.txt *.log)")[0]
+
+                if ok and target != '':
+                    style, separator = [(style, separator) for text, style, separator in LOG_STYLES if text == label][0]
+                    binary_to_text(source, target, style, separator, log_progress(self, "Converting log..."))
+
+            else:
+                target = QFileDialog.getSaveFileName(self, "Save binary log", os.path.splitext(source)[0] + ".bin",
+                                                     "Binary log (*.bin)")[0]
+
+                if target != '':
+                    text_to_binary(source, target, log_progress(self, "Converting log..."))
+
+        except LogReadCancelled:
+            os.remove(target) # nedokoncana pretvorba
+
+        except (OSError, ValueError) as error:
+            QMessageBox.critical(self, "Convert log", str(error), QMessageBox.Ok)
+
     def debug(self):
         self.debugwindow = DebugWindow()
         self.mdiArea.addSubWindow(self.debugwindow)
@@ -211,6 +273,7 @@ class MainWindow(QMainWindow):
                                              QMessageBox.Yes | QMessageBox.No)
 
         if quit_question == QMessageBox.Yes:
+            port_registry.stop()
             sys.exit()
 
 '''
@@ -222,28 +285,37 @@ class ConfigSerial(QWidget):
     def __init__(self):
         super().__init__()
 
+        self.port = " "
+
         self.init()
         self.show()
 
     def init(self):
 
-        self.setGeometry(300, 300, 150, 120)
+        self.setGeometry(300, 300, 330, 120)
         self.setWindowTitle('Config serial port')
 
-        available_ports = [port[0] for port in list_ports.comports()]
-
         '''
             **********QComboBox*****************
         '''
-        combo = QComboBox(self)
-        combo.addItem("")
-        for i in range(0, len(available_ports)):
-            combo.addItem(available_ports[i])
+        self.combo = QComboBox(self)
+        fill_port_combo(self.combo)
+        port_registry.ports_changed.connect(self.fill_ports)
+        port_registry.probed.connect(self.port_probed)
 
         # combo.AdjustToContents
-        combo.move(110, 30)
-        combo.resize(110, 20)
-        combo.activated[str].connect(self.serial_port_select)
+        self.combo.move(110, 30)
+        self.combo.resize(160, 20)
+        self.combo.activated[int].connect(lambda index: self.serial_port_select(combo_port(self.combo, index)))
+
+        self.baudBox = QComboBox(self)
+        for rate in BAUD_RATES:
+            self.baudBox.addItem(str(rate), rate)
+
+        self.baudBox.move(110, 55)
+        self.baudBox.resize(100, 20)
+        self.baudBox.setEnabled(False)
+        self.baudBox.activated[int].connect(self.baudrate_select)
 
         '''
              **********Buttons*****************
@@ -251,6 +323,10 @@ class ConfigSerial(QWidget):
         self.connectButton = QPushButton("Test connection")
         self.connectButton.clicked.connect(self.serial_button_colour)
 
+        self.detectButton = QPushButton("Auto baud")
+        self.detectButton.setEnabled(False)
+        self.detectButton.clicked.connect(self.detect_baudrate)
+
         ok_button = QPushButton("OK")
         ok_button.clicked.connect(self.ok)
 
@@ -258,6 +334,7 @@ class ConfigSerial(QWidget):
         hbox.addStretch(1)
 
         hbox.addWidget(self.connectButton)
+        hbox.addWidget(self.detectButton)
         hbox.addSpacing(100)
         hbox.addWidget(ok_button)
 
@@ -267,40 +344,86 @@ class ConfigSerial(QWidget):
 
         self.setLayout(vbox)
 
+    def fill_ports(self):
+        fill_port_combo(self.combo)
+
+    def closeEvent(self, event):
+        unwatch_ports(self.fill_ports)
+
+        try:
+            port_registry.probed.disconnect(self.port_probed)
+
+        except TypeError:
+            pass
+
     def ok(self):
         self.close()
 
     def serial_port_select(self, text):
         self.port = text
 
+        self.baudBox.setEnabled(text != " ")
+        self.detectButton.setEnabled(text != " ")
+
+        if text != " ":
+            self.baudBox.setCurrentIndex(max(self.baudBox.findData(link_settings.baudrate(text)), 0))
+
+    def baudrate_select(self, index):
+        link_settings.set_baudrate(self.port, self.baudBox.itemData(index))
+
+    def detect_baudrate(self):
+        self.detectButton.setEnabled(False)
+        self.detectButton.setStyleSheet("")
+
+        self.detect_thread = BaudDetectThread(self.port)
+        self.detect_thread.detected.connect(self.baudrate_detected)
+        self.detect_thread.start()
+
+    def baudrate_detected(self, port, rate):
+        self.detect_thread.wait()
+        self.detectButton.setEnabled(True)
+
+        if self.detect_thread.error is not None:
+            port_error(self, self.detect_thread.error)
+
+        elif rate is None:
+            self.detectButton.setStyleSheet("background-color: red")
+
+        else:
+            self.detectButton.setStyleSheet("background-color: green")
+            if port == self.port:
+                self.baudBox.setCurrentIndex(max(self.baudBox.findData(rate), 0))
+
     def serial_button_colour(self):
 
         # self.connectButton.setStyleSheet("background-color: green")
         # sudo chmod 777 /dev/ttyUSB0
 
-        #ser = serial.Serial(port, 9600)
-
-        self.serial = serial.Serial(
-            port=self.port,
-            baudrate=9600,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            timeout=1)
+        if self.port == " ":
+            return
 
-        self.serial.write(b'IR_SW_INFO')
+        # rokovanje opravi nit registra, odgovor pride v port_probed
+        self.connectButton.setEnabled(False)
+        self.connectButton.setStyleSheet("")
+        port_registry.request_probe(self.port)
 
-        #with serial.Serial(port, 9600, timeout=1) as ser:
+    def port_probed(self, port, version, busy):
+        if port != self.port:
+            return
 
-        s = self.serial.read(10)  # read up to ten bytes (timeout)
+        self.connectButton.setEnabled(True)
 
-        line = self.serial.readline()  # read a '\n' terminated line
+        if busy:
+            self.connectButton.setStyleSheet("background-color: orange")
+            self.connectButton.setToolTip("Port is in use, try again later.")
 
-        if line == b'le IR Switch Version: 0.9.0 2016\r\n':
+        elif version is not None:
             self.connectButton.setStyleSheet("background-color: green")
+            self.connectButton.setToolTip("IR Switch version " + version)
 
-        elif line != b'le IR Switch Version: 0.9.0 2016\r\n':
+        else:
             self.connectButton.setStyleSheet("background-color: red")
+            self.connectButton.setToolTip("No sensor answered.")
 
 '''
 ----------  Config sensor window  ----------
@@ -315,10 +438,12 @@ class ConfigSensor(QWidget):
         self.pulse = 0 # 1: 10ms 2: random
         self.sensor_adc = 0 # 1: adc_ON 2: adc_OFF
         self.calibrate = 0 # ne izvedi kalibracije
+        self.engine = None
 
         self.config_sensor(self)
 
     def closeEvent(self, event):
+        unwatch_ports(self.fill_ports)
         self.config_exit()
 
     def config_sensor(self, ConfigSensor):
@@ -334,12 +459,8 @@ class ConfigSensor(QWidget):
         self.comboBox = QComboBox(ConfigSensor)
         self.comboBox.setGeometry(QRect(170, 20, 116, 22))
         self.comboBox.setObjectName("comboBox")
-        self.comboBox.addItem(" ")
-
-        available_ports = [port[0] for port in list_ports.comports()]
-
-        for i in range(0, len(available_ports)):
-            self.comboBox.addItem(available_ports[i])
+        fill_port_combo(self.comboBox)
+        port_registry.ports_changed.connect(self.fill_ports)
 
         self.groupBox = QGroupBox(ConfigSensor)
         self.groupBox.setGeometry(QRect(20, 70, 167, 81))
@@ -410,11 +531,48 @@ class ConfigSensor(QWidget):
         self.groupBox_3.raise_()
         self.label.raise_()
 
+        self.status_label = QLabel(ConfigSensor)
+        self.status_label.setGeometry(QRect(20, 290, 175, 23))
+        self.status_label.setText("")
+
+        self.groupBox_4 = QGroupBox(ConfigSensor)
+        self.groupBox_4.setGeometry(QRect(195, 160, 171, 111))
+        self.groupBox_4.setTitle("Profile:")
+
+        self.profileBox = QComboBox(self.groupBox_4)
+        self.profileBox.setGeometry(QRect(10, 20, 151, 22))
+        self.profileBox.setEditable(True)
+        self.profileBox.addItem("")
+        for name in sorted(load_profiles()):
+            self.profileBox.addItem(name)
+
+        self.save_profile_button = QPushButton(self.groupBox_4)
+        self.save_profile_button.setGeometry(QRect(10, 50, 75, 23))
+        self.save_profile_button.setText("Save")
+
+        self.checkBox_changed = QCheckBox(self.groupBox_4)
+        self.checkBox_changed.setGeometry(QRect(10, 80, 151, 18))
+        self.checkBox_changed.setText("Only changed settings")
+        self.checkBox_changed.setToolTip("Skip settings this PC last confirmed on the sensor.\n"
+                                         "The sensor cannot report its settings, so changes made\n"
+                                         "elsewhere are not seen; needs a USB serial number.")
+
+        # skupine radijskih gumbov, da jih load_profile lahko vse odznaci
+        self.out_group = QButtonGroup(ConfigSensor)
+        self.pulse_group = QButtonGroup(ConfigSensor)
+        self.adc_group = QButtonGroup(ConfigSensor)
+
+        for group, buttons in ((self.out_group, (self.radioButton, self.radioButton_2)),
+                               (self.pulse_group, (self.radioButton_3, self.radioButton_4)),
+                               (self.adc_group, (self.radioButton_5, self.radioButton_6))):
+            for button in buttons:
+                group.addButton(button)
+
         self.retranslateUi(ConfigSensor)
         QMetaObject.connectSlotsByName(ConfigSensor)
 
     def retranslateUi(self, ConfigSensor):
-        self.comboBox.activated[str].connect(self.serial_port_select)
+        self.comboBox.activated[int].connect(lambda index: self.serial_port_select(combo_port(self.comboBox, index)))
 
         self.radioButton.clicked.connect(self.sensor_nc)
         self.radioButton_2.clicked.connect(self.sensor_no)
@@ -427,25 +585,32 @@ class ConfigSensor(QWidget):
 
         self.checkBox.stateChanged.connect(self.enable_calibrate)
 
+        self.profileBox.activated[str].connect(self.load_profile)
+        self.save_profile_button.clicked.connect(self.store_profile)
+
         self.buttonBox.accepted.connect(self.sensor_programming)
         self.buttonBox.rejected.connect(self.config_exit)
 
+    def fill_ports(self):
+        fill_port_combo(self.comboBox)
+
     def serial_port_select(self, text):
         self.port = text
 
         if self.serial_selected == 1:
-            self.ser.close()
+            data_bus.unsubscribe(self.replies)
             self.serial_selected = 0
 
         if text != " ":
-            self.ser = serial.Serial(
-                port=self.port,
-                baudrate=9600,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=1)
+            try:
+                self.replies = data_bus.subscribe(self.port, "lines")
+
+            except serial.SerialException as error:
+                port_error(self, error)
+                self.comboBox.setCurrentIndex(0)
+                text = " "
 
+        if text != " ":
             self.serial_selected = 1
 
             self.groupBox.setEnabled(True)
@@ -486,7 +651,13 @@ class ConfigSensor(QWidget):
 
     def config_exit(self):
         if self.serial_selected == 1:
-            self.ser.close()
+            self.serial_selected = 0
+
+            if self.engine is not None:
+                self.engine.cancel() # programming_done sprosti narocnino
+
+            else:
+                data_bus.unsubscribe(self.replies)
 
         self.close()
 
@@ -513,417 +684,3822 @@ class ConfigSensor(QWidget):
     def exit_msg(self):
         self.msg.close()
 
-    def sensor_programming(self):
-        error = 2
+    def current_profile(self):
+        return {"out_type": self.out_type, "pulse": self.pulse,
+                "sensor_adc": self.sensor_adc, "calibrate": self.calibrate}
 
-        if self.out_type == 1: # 1: NC 2: NO
-            self.ser.write(b'SW_MODE_NC')
-            s = self.ser.read(0)
-            line = self.ser.readline()
-            if line in (b'Izhod deljuje kot NC!\r\n',  b'Izhod ze deljuje kot NC.\r\n'):
-                error = 0
+    def load_profile(self, name):
+        profile = load_profiles().get(name)
 
-            else:
-                error = 1
+        if profile is None:
+            return
 
-        elif self.out_type == 2:  # 1: NC 2: NO
-            self.ser.write(b'SW_MODE_NO')
-            s = self.ser.read(0)
-            line = self.ser.readline()
-            if line in (b'Izhod deljuje kot NO!\r\n', b'Izhod ze deljuje kot NO.\r\n'):
-                error = 0
+        self.out_type = profile.get("out_type", 0)
+        self.pulse = profile.get("pulse", 0)
+        self.sensor_adc = profile.get("sensor_adc", 0)
 
-            else:
-                error = 1
+        for group, value in ((self.out_group, self.out_type), (self.pulse_group, self.pulse),
+                             (self.adc_group, self.sensor_adc)):
+            # izbira 0 = noben gumb; izkljucujoca skupina ne dovoli odznaciti vseh
+            group.setExclusive(False)
 
-        if self.pulse == 1:  # 1: 10ms 2: random
-            self.ser.write(b'PULSEMODE0')
-            s = self.ser.read(0)
-            line = self.ser.readline()
-            if line in (b'Osnovni nacin generiranja pulza: Pulz = 10ms\r\n', b'Osnovni nacin generiranja pulza je ze vkljucen!\r\n'):
-                error = 0
+            for index, button in enumerate(group.buttons()):
+                button.setChecked(value == index + 1)
 
-            else:
-                error = 1
+            group.setExclusive(True)
 
-        elif self.pulse == 2:  # 1: 10ms 2: random
-            self.ser.write(b'PULSEMODE1')
-            s = self.ser.read(0)
-            line = self.ser.readline()
-            if line in (b'Random nacin generiranja pulza vkljucen!\r\n', b'Random nacin generiranja pulza je ze vkljucen!'):
-                error = 0
+        self.checkBox.setEnabled(self.sensor_adc == 1)
+        self.checkBox.setChecked(profile.get("calibrate", 0) == 1) # enable_calibrate preklopi self.calibrate
 
-            else:
-                error = 1
+    def store_profile(self):
+        name = self.profileBox.currentText().strip()
 
-        if self.sensor_adc == 1:  # 1: adc_ON 2: adc_OFF
-            self.ser.write(b'ADC_MODE_1')
-            s = self.ser.read(0)
-            line = self.ser.readline()
-            if line in (b'ADC preverjanje pulza aktivirano!\r\n', b'ADC preverjanje pulza je ZE aktivirano!\r\n'):
-                error = 0
+        if name == "":
+            return
 
-            else:
-                error = 1
+        save_profile(name, self.current_profile())
 
-        elif self.sensor_adc == 2:  # 1: adc_ON 2: adc_OFF
-            self.ser.write(b'ADC_MODE_0')
-            s = self.ser.read(0)
-            line = self.ser.readline()
-            if line in (b'ADC preverjanje pulza je deaktivirano!\r\n', b'ADC preverjanje pulza je ZE deaktivirano!\r\n'):
-                error = 0
+        if self.profileBox.findText(name) < 0:
+            self.profileBox.addItem(name)
 
-            else:
-                error = 1
+    def selected_commands(self):
+        # privzeto posljemo vse: shranjeno stanje je lahko zastarelo
+        if self.checkBox_changed.isChecked():
+            state = load_device_state(device_id(self.port))
+
+        else:
+            state = {}
+
+        return profile_commands(self.current_profile(), state)
+
+    def sensor_programming(self):
+        if self.serial_selected == 0 or self.engine is not None:
+            return
 
-        if self.calibrate == 1:  # ne izvedi kalibracije
-            self.ser.write(b'CALIBRATE1')
-            s = self.ser.read(0)
-            line = self.ser.readline()
-            if line == b'Izvaja se ADC kalibracijski proces senzorja!\r\n':
-                error = 0
+        commands = self.selected_commands()
+
+        if not commands:
+            if self.checkBox_changed.isChecked():
+                self.status_label.setText("Nothing sent: no change since last time.")
 
             else:
-                error = 1
+                self.status_label.setText("No settings selected.")
+
+            return
+
+        self.buttonBox.setEnabled(False)
+        self.comboBox.setEnabled(False) # engine uporablja self.replies
+
+        self.engine = CommandEngine(self.replies, commands)
+        self.engine.command_done.connect(self.programming_step)
+        self.engine.batch_done.connect(self.programming_done)
+        self.engine.start()
+
+    def programming_step(self, result):
+        self.status_label.setText(result.command.command.decode() + ": " + result.status)
+
+    def programming_done(self, results):
+        self.engine.wait() # batch_done je zadnje, kar nit naredi
+        self.engine = None
+        self.buttonBox.setEnabled(True)
+        self.comboBox.setEnabled(True)
+
+        device = device_id(self.port)
+
+        if device is None:
+            forget_device_state(self.port) # brez serijske st. stanja ne hranimo
+
+        else:
+            update_device_state(device, results)
+
+        if self.serial_selected == 0:
+            data_bus.unsubscribe(self.replies) # okno je bilo zaprto med programiranjem
+            return
+
+        failed = [result for result in results if not result.ok]
 
-        if error == 1:
+        if failed:
             self.error_programming()
+            self.msg.setDetailedText("\n".join(result.command.command.decode() + " -> " + result.reply.decode("utf-8", "replace")
+                                               for result in failed))
             self.msg.show()
 
-        elif error == 0:
+        else:
             self.compeate_programming()
             self.msg.show()
 
             self.config_exit()
 
-        elif error == 2:
-            pass
+'''
+----------   Serial decoder   ----------
+'''
+
+
+class SerialDecoder(object):
+    """Reads the port in bulk and splits it into NUL-free lines."""
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.buffer = bytearray() # neobdelani bajti (nedokoncana vrstica)
+        self.raw = None # ByteRing za surove bajte (hex pogled)
+
+    def read_lines(self):
+        # everything already received; blocks up to ser.timeout for the first byte
+        data = self.ser.read(max(self.ser.in_waiting, 1))
+        if data:
+            self.buffer += data
+
+            if self.raw is not None:
+                self.raw.write(data)
+
+        end = self.buffer.rfind(b'\n')
+        if end < 0:
+            return []
+
+        with memoryview(self.buffer) as view:
+            block = view[:end].tobytes()
+
+        del self.buffer[:end + 1]
+
+        lines = [line.strip() for line in block.translate(None, b'\x00').split(b'\n')]
+
+        return [line for line in lines if line]
+
+    @staticmethod
+    def parse_values(lines):
+        """Numeric ADC/output frames from a batch of lines, as an int16 array."""
+        # vec kot 5 mest ne more biti int16, tudi int32 bi se pri dolgih vrsticah prelil
+        numbers = [line for line in lines if line.isdigit() and len(line) <= 5]
+
+        if not numbers:
+            return np.zeros(0, dtype=np.int16)
+
+        values = np.array(numbers).astype(np.int32)
+
+        return values[values <= np.iinfo(np.int16).max].astype(np.int16)
 
 '''
-----------  Debug window  ----------
+----------   Raw capture   ----------
 '''
 
+RAW_RING_SIZE = 1024 * 1024 # bajtov
+HEX_LINE = 16 # bajtov v vrstici
+HEX_PAGE = 32 * HEX_LINE # bajtov na stran
 
-class DebugWindow(QWidget):
-    def __init__(self):
-        super(DebugWindow, self).__init__()
-        self.serial_on = serial_on
-        self.setupUi(self)
+HEX_DIGITS = np.array(["%02x" % byte for byte in range(256)], dtype=object)
+HEX_ASCII = bytes([byte if 32 <= byte < 127 else ord(".") for byte in range(256)])
 
-    def closeEvent(self, event):
-        self.debug_exit()
 
-    def setupUi(self, Debug_window):
-        Debug_window.setObjectName("Debug_window")
-        Debug_window.resize(643, 577)
-        Debug_window.setWindowTitle("Debug")
+class ByteRing(object):
+    """Preallocated ring of the newest raw bytes of a port.
 
-        textEdit_font = QFont()
-        textEdit_font.setPointSize(14)
-        self.textEdit = QTextEdit(Debug_window)
-        self.textEdit.setGeometry(QRect(30, 20, 891, 701))
-        self.textEdit.setFont(textEdit_font)
+    The reader thread copies each read block in once; ring is a memoryview
+    of the whole buffer and segments() hands out views without copying.
+    Positions are absolute byte counts since the capture started.
+    """
 
-        comboBox_font = QFont()
-        comboBox_font.setPointSize(14)
-        self.comboBox = QComboBox(Debug_window)
-        self.comboBox.setGeometry(QRect(30, 730, 140, 30))
+    def __init__(self, capacity=RAW_RING_SIZE):
+        self.buffer = bytearray(capacity)
+        self.ring = memoryview(self.buffer)
+        self.capacity = capacity
+        self.total = 0
+        self.lock = threading.Lock()
 
-        self.comboBox.setFrame(False)
-        self.comboBox.addItem(" ")
+    def write(self, data):
+        size = len(data)
+        data = memoryview(data)[-self.capacity:] # starejsi bajti bi bili takoj prepisani
 
-        available_ports = [port[0] for port in list_ports.comports()]
+        with self.lock:
+            start = (self.total + size - len(data)) % self.capacity
+            first = min(len(data), self.capacity - start)
 
-        for i in range(0, len(available_ports)):
-            self.comboBox.addItem(available_ports[i])
+            self.ring[start:start + first] = data[:first]
+            self.ring[:len(data) - first] = data[first:]
 
-        self.comboBox.setFont(comboBox_font)
+            self.total += size
 
-        lineEdit_font = QFont()
-        lineEdit_font.setPointSize(14)
-        self.lineEdit = QLineEdit(Debug_window)
-        self.lineEdit.setGeometry(QRect(180, 730, 540, 30))
-        self.lineEdit.setFont(lineEdit_font)
+    def first(self):
+        return max(self.total - self.capacity, 0)
 
-        send_font = QFont()
-        send_font.setPointSize(16)
-        self.send_button = QPushButton(Debug_window)
-        self.send_button.setGeometry(QRect(730, 730, 100, 30))
-        self.send_button.setText("Send")
-        self.send_button.setFont(send_font)
+    def segments(self, start, end):
+        """Views of the bytes [start, end) still held by the ring; hold lock."""
+        start = max(start, self.first())
+        end = min(end, self.total)
 
-        self.retranslateUi(Debug_window)
-        QMetaObject.connectSlotsByName(Debug_window)
+        if start >= end:
+            return []
 
-    def retranslateUi(self, Debug_window):
-        self.send_button.clicked.connect(self.send)
-        self.comboBox.activated[str].connect(self.serial_port_select)
+        begin = start % self.capacity
+        length = end - start
 
-    def serial_port_select(self, text):
-        self.port = text
+        if begin + length <= self.capacity:
+            return [self.ring[begin:begin + length]]
 
-        self.serial_on = 0
+        return [self.ring[begin:], self.ring[:begin + length - self.capacity]]
 
-        if text != " ":
-            self.serial = serial.Serial(
-                port=self.port,
-                baudrate=9600,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=1)
-
-            self.debugthread = DebugThread(self.port)
-            self.debugthread.debug_thread.connect(self.receive)
-            self.debugthread.setTerminationEnabled()
-            self.debugthread.start()
+    def read(self, start, end):
+        with self.lock:
+            start = max(start, self.first())
+            return start, b"".join([bytes(segment) for segment in self.segments(start, end)])
 
-            self.serial_on = 1
 
-    def send(self):
-        command = self.lineEdit.text()
+def hex_dump(data, offset):
+    """Hex + ASCII lines of data that starts at absolute position offset."""
+    codes = np.frombuffer(data, dtype=np.uint8)
+    lines = []
 
-        if command == "clr":
-            self.textEdit.clear()
+    for i in range(0, len(data), HEX_LINE):
+        row = codes[i:i + HEX_LINE]
+        pad = HEX_LINE - len(row)
 
-        else:
-            self.serial.write(command.encode('ascii'))
-            self.clock = dt.now()
-            self.textEdit.setTextColor(Qt.blue)
-            self.textEdit.append(str(self.clock.strftime("%d.%m.%Y %H:%M")) + '<- ' + command)
+        lines.append("%08x  " % (offset + i) + " ".join(HEX_DIGITS[row]) + "   " * pad +
+                     "  |" + data[i:i + HEX_LINE].translate(HEX_ASCII).decode('ascii') + "|")
 
-        time.sleep(0.2)
+    return "\n".join(lines)
 
-    def receive(self, message):
-        message = message.strip()
-        self.clock = dt.now()
-        self.textEdit.setTextColor(Qt.red)
-        self.textEdit.append(str(self.clock.strftime("%d.%m.%Y %H:%M")) + '-> ' + message)
+'''
+----------   Link settings   ----------
+'''
 
-    def debug_exit(self):
-        if self.serial_on == 1:
-            self.serial_on = 0
-            self.debugthread.closeEvent(self.closeEvent)
-            self.serial.close()
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".programmable-optic-sensor")
+
+BAUD_RATES = (9600, 19200, 38400, 57600, 115200, 230400, 460800)
+DEFAULT_BAUDRATE = 9600
+
+
+def load_json(name, default):
+    try:
+        with open(os.path.join(CONFIG_DIR, name), 'r', encoding='utf8') as data:
+            return json.load(data)
+
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(name, value):
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    location = os.path.join(CONFIG_DIR, name)
+
+    with open(location + ".tmp", 'w', encoding='utf8') as data:
+        json.dump(value, data, indent=1, sort_keys=True)
+
+    os.replace(location + ".tmp", location)
+
+
+class LinkSettings(object):
+    """Per-port line settings used by every window (link.json)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rates = None
+
+    def baudrate(self, port):
+        with self.lock:
+            if self.rates is None:
+                self.rates = load_json("link.json", {})
+
+            return self.rates.get(port, DEFAULT_BAUDRATE)
+
+    def set_baudrate(self, port, rate):
+        self.baudrate(port)
+
+        with self.lock:
+            self.rates[port] = rate
+            save_json("link.json", self.rates)
+
+        serial_manager.reconfigure(port)
+
+
+link_settings = LinkSettings()
+
+
+def detect_baudrate(port, timeout=0.5):
+    """Try the handshake at every rate, save the first that answers.
+
+    Trial rates only reconfigure the open port; the port must not be used
+    by any other window meanwhile.
+    """
+    replies = data_bus.subscribe(port, "lines")
+
+    try:
+        if data_bus.attached(port) > 1:
+            raise PortBusyError("Port " + port + " is in use by another window.")
+
+        original = link_settings.baudrate(port)
+        rates = [original] + [rate for rate in BAUD_RATES if rate != original]
+
+        for rate in rates:
+            serial_manager.reconfigure(port, rate)
+            line = data_bus.request(replies, b'IR_SW_INFO', timeout)
+
+            if VERSION_PATTERN.search(line):
+                link_settings.set_baudrate(port, rate)
+                return rate
+
+        serial_manager.reconfigure(port, original)
 
+        return None
 
-class DebugThread(QThread):
-    debug_thread = pyqtSignal(str)
+    finally:
+        data_bus.unsubscribe(replies)
+
+
+class BaudDetectThread(QThread):
+    detected = pyqtSignal(str, object) # port, hitrost ali None
 
     def __init__(self, port):
-        super(DebugThread, self).__init__()
+        super(BaudDetectThread, self).__init__()
+
+        self.port = port
+        self.error = None
+
+    def run(self):
+        try:
+            rate = detect_baudrate(self.port)
+
+        except serial.SerialException as error:
+            self.error = error
+            rate = None
+
+        self.detected.emit(self.port, rate)
+
+'''
+----------   Serial connection manager   ----------
+'''
+
+SERIAL_TIMEOUT = 0.05 # timeout ene branja na deljenem portu [s]
+
+
+class PortBusyError(serial.SerialException):
+    pass
+
+
+class SerialLink(object):
+    """One open port, lent to windows by SerialManager."""
 
+    def __init__(self, port):
         self.port = port
         self.ser = serial.Serial(
-            port=self.port,
-            baudrate=9600,
+            port=port,
+            baudrate=link_settings.baudrate(port),
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
             bytesize=serial.EIGHTBITS,
-            timeout=1)
+            timeout=SERIAL_TIMEOUT)
+
+        self.decoder = SerialDecoder(self.ser)
+        self.pending = collections.deque() # prebrane, se neobdelane vrstice
+        self.read_lock = threading.Lock() # decoder in pending: bralec ali set_baudrate
+        self.write_lock = threading.Lock()
+
+        self.owners = set()
+        self.exclusive = None
+
+    def close(self):
+        try:
+            self.ser.close()
+
+        except (serial.SerialException, OSError):
+            pass # naprava je ze odklopljena
+
+    def set_baudrate(self, rate):
+        # pocakamo, da bralec konca branje (najvec SERIAL_TIMEOUT)
+        with self.read_lock, self.write_lock:
+            self.ser.baudrate = rate
+            self.ser.reset_input_buffer()
+            self.decoder.buffer.clear() # bajti pri stari hitrosti so neuporabni
+            self.pending.clear()
+
+    def write(self, data):
+        with self.write_lock:
+            self.ser.write(data)
+
+    def read_lines(self):
+        with self.read_lock:
+            lines = list(self.pending)
+            self.pending.clear()
+
+            return lines + self.decoder.read_lines()
+
+    def read_reply(self, timeout=1.0):
+        """Next text line (numeric frames are skipped), b'' on timeout."""
+        deadline = time.monotonic() + timeout
+        expired = False
+
+        while True:
+            with self.read_lock:
+                while self.pending:
+                    line = self.pending.popleft()
+                    if not line.isdigit():
+                        return line
+
+                if expired:
+                    return b''
+
+                # one last read of whatever is already waiting after the deadline
+                expired = time.monotonic() >= deadline
+                if not expired or self.ser.in_waiting > 0:
+                    self.pending.extend(self.decoder.read_lines())
+
+    def request(self, command, timeout=1.0):
+        self.write(command)
+
+        return self.read_reply(timeout)
+
+
+class SerialManager(object):
+    """Opens each port once and lends it with shared or exclusive access."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.links = {}
+
+    def acquire(self, port, owner, exclusive=False):
+        with self.lock:
+            link = self.links.get(port)
+
+            if link is None:
+                link = SerialLink(port)
+                self.links[port] = link
+
+            others = link.owners - {owner}
+            if link.exclusive not in (None, owner) or (exclusive and others):
+                raise PortBusyError("Port " + port + " is in use by another window.")
+
+            link.owners.add(owner)
+            if exclusive:
+                link.exclusive = owner
+
+            return link
+
+    def reconfigure(self, port, rate=None):
+        """Apply the saved (or a trial) rate to an open port."""
+        with self.lock:
+            link = self.links.get(port)
+
+            if link is not None:
+                link.set_baudrate(link_settings.baudrate(port) if rate is None else rate)
+
+    def release(self, port, owner):
+        with self.lock:
+            link = self.links.get(port)
+
+            if link is None:
+                return
+
+            link.owners.discard(owner)
+            if link.exclusive == owner:
+                link.exclusive = None
+
+            if not link.owners:
+                link.close()
+                del self.links[port]
+
+
+serial_manager = SerialManager()
+
+
+def port_error(parent, error):
+    QMessageBox.warning(parent, "Serial port", str(error), QMessageBox.Ok)
+
+'''
+----------   Data bus   ----------
+'''
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class Subscription(object):
+    """Bounded queue of one subscriber; a full queue drops, it never blocks."""
+
+    def __init__(self, port, topic, maxlen=1000, policy=DROP_OLDEST):
+        self.port = port
+        self.topic = topic # "lines" (cas, vrstica) ali "samples" (vrednosti, casi)
+        self.maxlen = maxlen
+        self.policy = policy
+        self.dropped = 0
+
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.error = None # razlog, ce je bil port odklopljen
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, item):
+        with self.lock:
+            if len(self.queue) >= self.maxlen:
+                self.dropped += 1
+
+                if self.policy == DROP_NEWEST:
+                    return
+
+                self.queue.popleft()
+
+            self.queue.append(item)
+            self.ready.set()
+
+    def close(self, error):
+        """The port is gone; get() no longer waits once the queue is empty."""
+        with self.lock:
+            self.error = error
+            self.ready.set()
+
+    def get_all(self):
+        with self.lock:
+            items = list(self.queue)
+            self.queue.clear()
+            self.ready.clear()
+
+        return items
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self.lock:
+                if self.queue:
+                    return self.queue.popleft()
+
+                if self.error is not None:
+                    return None
+
+                self.ready.clear()
+
+            if deadline is None:
+                self.ready.wait()
+
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+
+                self.ready.wait(remaining)
+
+    def reply(self, timeout=1.0):
+        """Next text line from a "lines" subscription, b'' on timeout."""
+        deadline = time.monotonic() + timeout
+
+        while True:
+            item = self.get(max(0.0, deadline - time.monotonic()))
+
+            if item is None:
+                return b''
+
+            if not item[1].isdigit():
+                return item[1]
+
+
+class PortReader(QThread):
+    """The only thread reading a port; publishes lines and sample batches."""
+
+    def __init__(self, link, bus, batch_size=DRAW_BATCH_SIZE, max_latency=DRAW_MAX_LATENCY):
+        super(PortReader, self).__init__()
+
+        self.link = link
+        self.bus = bus
+        self.batch_size = batch_size # najvec vzorcev v enem paketu
+        self.max_latency = max_latency # najdlje cakanje na paket [s]
+        self.kill_thread = 0
+
+    def stop(self):
+        self.kill_thread = 1
+        self.wait()
+
+    def run(self):
+        port = self.link.port
+
+        values = []
+        stamps = []
+        count = 0
+        first = 0.0
+
+        while self.kill_thread == 0:
+            try:
+                lines = self.link.read_lines()
+
+            except (serial.SerialException, OSError) as error:
+                # naprava odklopljena: izjema v QThread.run bi ustavila program
+                self.bus.disconnected(port, self, str(error))
+                return
+
+            if lines:
+                now = time.time()
+
+                for line in lines:
+                    self.bus.publish(port, "lines", (now, line))
+
+                received = SerialDecoder.parse_values(lines)
+
+                if len(received) > 0:
+                    if count == 0:
+                        first = time.monotonic()
+
+                    values.append(received)
+                    stamps.append(np.full(len(received), now))
+                    count += len(received)
+
+            if count > 0 and (count >= self.batch_size or time.monotonic() - first >= self.max_latency):
+                self.bus.publish(port, "samples", (np.concatenate(values), np.concatenate(stamps)))
+
+                values = []
+                stamps = []
+                count = 0
+
+
+class DataBus(object):
+    """One PortReader per port, shared by any number of subscribers."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.readers = {}
+        self.subscribers = {}
+
+    def subscribe(self, port, topic, maxlen=1000, policy=DROP_OLDEST):
+        with self.lock:
+            if port not in self.readers:
+                link = serial_manager.acquire(port, self)
+
+                reader = PortReader(link, self)
+                self.readers[port] = reader
+                self.subscribers[port] = []
+                reader.start()
+
+            subscription = Subscription(port, topic, maxlen, policy)
+            self.subscribers[port].append(subscription)
+
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            port = subscription.port
+            subscribers = self.subscribers.get(port, [])
+
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+
+            if port in self.readers and not subscribers:
+                self.readers.pop(port).stop()
+                del self.subscribers[port]
+                serial_manager.release(port, self)
+
+    def disconnected(self, port, reader, error):
+        """Called by a reader whose port failed: close its subscriptions and the port."""
+        with self.lock:
+            if self.readers.get(port) is not reader:
+                return
+
+            del self.readers[port]
+            subscribers = self.subscribers.pop(port, [])
+            serial_manager.release(port, self)
+
+        for subscription in subscribers:
+            subscription.close(error)
+
+        port_registry.request_probe(port) # register port odstrani ali ponovno preveri
+
+    def attached(self, port):
+        """Number of subscriptions on port."""
+        with self.lock:
+            return len(self.subscribers.get(port, ()))
+
+    def capture_raw(self, port, ring):
+        """Copy every byte read from port into ring (None stops)."""
+        with self.lock:
+            if port in self.readers:
+                self.readers[port].link.decoder.raw = ring
+
+    def publish(self, port, topic, item):
+        for subscription in list(self.subscribers.get(port, ())):
+            if subscription.topic == topic:
+                subscription.put(item)
+
+    def write(self, port, data):
+        reader = self.readers.get(port)
+
+        if reader is None:
+            raise serial.SerialException("Port " + port + " is not open.")
+
+        reader.link.write(data)
+
+    def request(self, replies, command, timeout=1.0):
+        """Send command and wait for its reply on a "lines" subscription."""
+        replies.get_all() # zavrzemo stare vrstice
+        self.write(replies.port, command)
+
+        return replies.reply(timeout)
+
+
+data_bus = DataBus()
+
+'''
+----------   Command engine   ----------
+'''
+
+# Najvec poslanih ukazov, ki se cakajo na odgovor.  Ukazi nimajo zakljucnega
+# znaka, firmware jih loci po premoru med njimi; vec ukazov zapored bi prispelo
+# kot en niz ("SW_MODE_NCPULSEMODE0..."), zato naslednjega posljemo sele po
+# odgovoru. Vecje okno le, ko firmware dobi potrjeno locilo ukazov.
+COMMAND_WINDOW = 1
+COMMAND_TIMEOUT = 1.0 # [s]
+
+CHANGED = "changed"
+UNCHANGED = "unchanged" # odgovor "ze ..." - nastavitev je ze bila izbrana
+FAILED = "failed"
+
+# ukaz: (odgovori ob spremembi, odgovori ko je nastavitev ze izbrana)
+COMMAND_REPLIES = {
+    b'SW_MODE_NC': ((b'Izhod deljuje kot NC!',), (b'Izhod ze deljuje kot NC.',)),
+    b'SW_MODE_NO': ((b'Izhod deljuje kot NO!',), (b'Izhod ze deljuje kot NO.',)),
+    b'PULSEMODE0': ((b'Osnovni nacin generiranja pulza: Pulz = 10ms',),
+                    (b'Osnovni nacin generiranja pulza je ze vkljucen!',)),
+    b'PULSEMODE1': ((b'Random nacin generiranja pulza vkljucen!',),
+                    (b'Random nacin generiranja pulza je ze vkljucen!',)),
+    b'ADC_MODE_1': ((b'ADC preverjanje pulza aktivirano!',), (b'ADC preverjanje pulza je ZE aktivirano!',)),
+    b'ADC_MODE_0': ((b'ADC preverjanje pulza je deaktivirano!',), (b'ADC preverjanje pulza je ZE deaktivirano!',)),
+    b'CALIBRATE1': ((b'Izvaja se ADC kalibracijski proces senzorja!',), ()),
+}
+
+
+class Command(object):
+    def __init__(self, command, timeout=COMMAND_TIMEOUT, setting=None, expect=None, delay=0.0):
+        self.command = command
+        self.timeout = timeout
+        self.setting = setting # (ime nastavitve, vrednost) za profile
+        self.expect = expect # regex pricakovanega odgovora (skripte)
+        self.delay = delay # premor pred posiljanjem [s]
+        self.changed, self.unchanged = COMMAND_REPLIES.get(command, ((), ()))
+
+    def match(self, reply):
+        if self.expect is not None:
+            return CHANGED if self.expect.search(reply) else FAILED
+
+        if reply in self.changed:
+            return CHANGED
+
+        if reply in self.unchanged:
+            return UNCHANGED
+
+        if not self.changed and not self.unchanged and reply:
+            return CHANGED # ukaz brez tabele odgovorov: vsak odgovor je dober
+
+        return FAILED
+
+
+class CommandResult(object):
+    def __init__(self, command, reply, status, latency):
+        self.command = command
+        self.reply = reply
+        self.status = status
+        self.latency = latency # [s]
+
+    @property
+    def ok(self):
+        return self.status != FAILED
+
+
+def run_commands(replies, commands, window=COMMAND_WINDOW, callback=None, stop=None):
+    """Pipeline commands over the port of a "lines" subscription.
+
+    Up to window commands are sent before their replies arrive; replies are
+    matched to commands in order. callback(result) is called as each one
+    completes and the results are returned in command order.  Once stop()
+    returns True no more commands are sent.
+    """
+    results = []
+    inflight = collections.deque() # (ukaz, cas posiljanja)
+    queued = collections.deque(commands)
+    unsent = []
+
+    replies.get_all() # zavrzemo stare vrstice
+
+    while queued or inflight:
+        while queued and len(inflight) < window:
+            if queued[0].delay and inflight:
+                break # premor: najprej pocakamo na odgovore poslanih ukazov
+
+            deadline = time.monotonic() + queued[0].delay
+            while stop is not None and not stop() and time.monotonic() < deadline:
+                time.sleep(min(0.05, deadline - time.monotonic()))
+
+            if stop is not None and stop():
+                queued.clear()
+                break
+
+            command = queued.popleft()
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+            try:
+                data_bus.write(replies.port, command.command)
+
+            except (serial.SerialException, OSError):
+                # port ni vec odprt: ukaz in vsi naslednji so neuspeli
+                unsent = [command] + list(queued)
+                queued.clear()
+                break
+
+            inflight.append((command, time.monotonic()))
+
+        if not inflight:
+            continue # ustavljeno, ni vec ukazov
+
+        command, sent = inflight[0]
+        reply = replies.reply(max(0.0, sent + command.timeout - time.monotonic()))
+        inflight.popleft()
+
+        status = command.match(reply) if reply else FAILED
+        result = CommandResult(command, reply, status, time.monotonic() - sent)
+        results.append(result)
+
+        if callback is not None:
+            callback(result)
+
+    for command in unsent:
+        result = CommandResult(command, b'', FAILED, 0.0)
+        results.append(result)
+
+        if callback is not None:
+            callback(result)
+
+    return results
+
+
+def parse_script(text):
+    """Commands of a console script.
+
+    One command per line, optionally followed by "~ regex" that its reply
+    must match; "wait <ms>" pauses before the next command and "#" starts
+    a comment.  In the console ";" can stand for a new line.
+    """
+    commands = []
+    delay = 0.0
+
+    for number, line in enumerate(text.replace(";", "\n").splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+
+        if not line:
+            continue
+
+        if line.lower().startswith("wait "):
+            try:
+                delay += float(line[5:]) / 1000.0
+
+            except ValueError:
+                raise ValueError("Line " + str(number) + ": bad wait time: " + line[5:])
+
+            continue
+
+        command, _, expect = line.partition("~")
+
+        try:
+            expect = re.compile(expect.strip().encode('utf8')) if expect.strip() else None
+
+        except re.error as error:
+            raise ValueError("Line " + str(number) + ": bad regex: " + str(error))
+
+        commands.append(Command(command.strip().encode('ascii'), expect=expect, delay=delay))
+        delay = 0.0
+
+    return commands
+
+
+class CommandEngine(QThread):
+    """Runs a batch of commands off the GUI thread."""
+    command_done = pyqtSignal(object) # CommandResult
+    batch_done = pyqtSignal(object) # seznam CommandResult
+
+    def __init__(self, replies, commands, window=COMMAND_WINDOW):
+        super(CommandEngine, self).__init__()
+
+        self.replies = replies
+        self.commands = commands
+        self.window = window
+        self.cancelled = False
+
+    def cancel(self):
+        """Send no further commands; batch_done follows with what was run."""
+        self.cancelled = True
+
+    def run(self):
+        results = run_commands(self.replies, self.commands, self.window, self.command_done.emit,
+                               lambda: self.cancelled)
+        self.batch_done.emit(results)
+
+'''
+----------   Config profiles   ----------
+'''
+
+STATE_LOCK = threading.Lock() # device_state.json pisejo tudi FleetWorker niti
+
+# nastavitev: {vrednost v ConfigSensor: ukaz}
+PROFILE_COMMANDS = {
+    "out_type": {1: b'SW_MODE_NC', 2: b'SW_MODE_NO'},
+    "pulse": {1: b'PULSEMODE0', 2: b'PULSEMODE1'},
+    "sensor_adc": {1: b'ADC_MODE_1', 2: b'ADC_MODE_0'},
+}
+
+
+def port_info(port):
+    for info in list_ports.comports():
+        if info.device == port:
+            return info
+
+    return None
+
+
+def device_id(port):
+    """USB serial number of the sensor on a port, None when it has none.
+
+    hwid and the port name identify the adapter, not the sensor, so they are
+    never used as keys of the stored device state.
+    """
+    info = port_info(port)
+
+    return info.serial_number if info is not None and info.serial_number else None
+
+
+def load_profiles():
+    return load_json("profiles.json", {})
+
+
+def save_profile(name, profile):
+    profiles = load_profiles()
+    profiles[name] = profile
+    save_json("profiles.json", profiles)
+
+
+def profile_commands(profile, state):
+    """Commands for the settings of profile that differ from the known state.
+
+    The firmware has no command that reads the configuration back, so state
+    is the last configuration the device confirmed (see update_device_state).
+    Unknown settings are always sent; calibration is always sent when asked.
+    With an empty state every setting of the profile is sent.
+    """
+    commands = []
+
+    for setting in ("out_type", "pulse", "sensor_adc"):
+        value = profile.get(setting, 0)
+
+        if value in PROFILE_COMMANDS[setting] and state.get(setting) != value:
+            commands.append(Command(PROFILE_COMMANDS[setting][value], setting=(setting, value)))
+
+    if profile.get("calibrate", 0) == 1:
+        commands.append(Command(b'CALIBRATE1'))
+
+    return commands
+
+
+def load_device_state(device):
+    if device is None:
+        return {}
+
+    return load_json("device_state.json", {}).get(device, {})
+
+
+def forget_device_state(port):
+    """Drop the stored state of the sensor on port (and old port/hwid keys)."""
+    with STATE_LOCK:
+        states = load_json("device_state.json", {})
+
+        if not states:
+            return
+
+        info = port_info(port)
+        keys = [port] if info is None else [key for key in (info.serial_number, info.hwid, port) if key]
+
+        if any(key in states for key in keys):
+            for key in keys:
+                states.pop(key, None)
+
+            save_json("device_state.json", states)
+
+
+def update_device_state(device, results):
+    if device is None:
+        return
+
+    with STATE_LOCK:
+        states = load_json("device_state.json", {})
+        state = states.setdefault(device, {})
+
+        for result in results:
+            setting = result.command.setting
+
+            if setting is None:
+                continue
+
+            if result.ok:
+                state[setting[0]] = setting[1]
+
+            else:
+                state.pop(setting[0], None) # stanje ni vec znano
+
+        save_json("device_state.json", states)
+
+'''
+----------  Fleet programming  ----------
+'''
+
+FLEET_RETRIES = 2 # ponovitve neuspelih ukazov na napravo
+CALIBRATION_DONE = b'Kalibracijski proces uspesno zakljucen'
+CALIBRATION_TIMEOUT = 10.0 # [s] kalibracija traja priblizno 7 s
+
+
+class FleetWorker(QThread):
+    """Programs one port: diff, retries and a readback of the profile."""
+    progress = pyqtSignal(str, str) # port, sporocilo
+    port_done = pyqtSignal(str, object) # port, povzetek
+
+    def __init__(self, port, profile, only_changed=False, retries=FLEET_RETRIES):
+        super(FleetWorker, self).__init__()
+
+        self.port = port
+        self.profile = dict(profile)
+        self.only_changed = only_changed
+        self.retries = retries
+        self.cancelled = False
+
+    def cancel(self):
+        """Send no further commands (does not block); port_done follows."""
+        self.cancelled = True
+
+    def is_cancelled(self):
+        return self.cancelled
+
+    def report(self, result):
+        self.progress.emit(self.port, result.command.command.decode() + ": " + result.status)
+
+    def wait_calibration(self, replies):
+        """Wait for the end of calibration; the sensor does not take commands meanwhile."""
+        deadline = time.monotonic() + CALIBRATION_TIMEOUT
+
+        while not self.cancelled and time.monotonic() < deadline:
+            if replies.reply(min(0.2, max(0.0, deadline - time.monotonic()))) == CALIBRATION_DONE:
+                return True
+
+        return False
+
+    def run(self):
+        start = time.monotonic()
+        summary = {"ok": False, "attempts": 0, "readback": False, "message": ""}
+
+        try:
+            replies = data_bus.subscribe(self.port, "lines")
+
+        except serial.SerialException as error:
+            summary["message"] = str(error)
+            summary["time"] = time.monotonic() - start
+            self.port_done.emit(self.port, summary)
+            return
+
+        device = device_id(self.port)
+
+        if device is None:
+            forget_device_state(self.port)
+
+        state = load_device_state(device) if self.only_changed else {}
+        profile = self.profile
+        calibrated = False
+
+        while summary["attempts"] <= self.retries and not self.cancelled:
+            summary["attempts"] += 1
+
+            results = run_commands(replies, profile_commands(profile, state), callback=self.report,
+                                   stop=self.is_cancelled)
+            update_device_state(device, results)
+
+            # ponovimo le neuspele ukaze
+            state = dict(state)
+            state.update(result.command.setting for result in results if result.ok and result.command.setting)
+
+            if any(result.command.command == b'CALIBRATE1' and result.ok for result in results):
+                profile = dict(profile, calibrate=0)
+                calibrated = True
+
+            failed = [result for result in results if not result.ok]
+            if not failed:
+                summary["ok"] = True
+                break
+
+            summary["message"] = failed[-1].command.command.decode() + " -> " + failed[-1].reply.decode("utf-8", "replace")
+
+        if summary["ok"] and calibrated:
+            self.progress.emit(self.port, "calibrating")
+
+            if not self.wait_calibration(replies):
+                summary["ok"] = False
+                summary["message"] = "calibration not finished"
+
+        if summary["ok"] and not self.cancelled:
+            # every setting sent again must be answered with "already set"
+            self.progress.emit(self.port, "readback")
+            readback = run_commands(replies, profile_commands(dict(self.profile, calibrate=0), {}), callback=self.report,
+                                    stop=self.is_cancelled)
+            summary["readback"] = all(result.status == UNCHANGED for result in readback)
+            summary["message"] = "" if summary["readback"] else "readback mismatch"
+
+        if self.cancelled: # preklicane serije so lahko nepopolne
+            summary["ok"] = False
+            summary["readback"] = False
+            summary["message"] = "cancelled"
+
+        data_bus.unsubscribe(replies)
+
+        summary["time"] = time.monotonic() - start
+        self.port_done.emit(self.port, summary)
+
+
+class FleetWindow(QWidget):
+    def __init__(self):
+        super(FleetWindow, self).__init__()
+
+        self.workers = {}
+        self.rows = {}
+        self.start_time = 0.0
+
+        self.fleet_ui(self)
+
+    def closeEvent(self, event):
+        unwatch_ports(self.fill_ports)
+
+        # delavci se koncajo sami in se javijo v port_done
+        for worker in self.workers.values():
+            worker.cancel()
+
+    def fleet_ui(self, FleetWindow):
+        FleetWindow.setWindowTitle("Fleet programming")
+        FleetWindow.resize(815, 500)
+
+        self.portList = QListWidget()
+        self.portList.setMaximumWidth(200)
+
+        self.fill_ports()
+        port_registry.ports_changed.connect(self.fill_ports)
+
+        self.profileBox = QComboBox()
+        for name in sorted(load_profiles()):
+            self.profileBox.addItem(name)
+
+        self.checkBox_changed = QCheckBox()
+        self.checkBox_changed.setText("Only changed settings")
+
+        self.start_button = QPushButton()
+        self.start_button.setText("Program")
+
+        self.table = QTableWidget(0, 6)
+        self.table.setHorizontalHeaderLabels(["Port", "Progress", "Attempts", "Time [s]", "Readback", "Result"])
+        self.table.horizontalHeader().setStretchLastSection(True)
+
+        self.summary_label = QLabel()
+
+        left = QVBoxLayout()
+        left.addWidget(QLabel("Ports:"))
+        left.addWidget(self.portList)
+        left.addWidget(QLabel("Profile:"))
+        left.addWidget(self.profileBox)
+        left.addWidget(self.checkBox_changed)
+        left.addWidget(self.start_button)
+
+        right = QVBoxLayout()
+        right.addWidget(self.table)
+        right.addWidget(self.summary_label)
+
+        hbox = QHBoxLayout()
+        hbox.addLayout(left)
+        hbox.addLayout(right)
+        self.setLayout(hbox)
+
+        self.start_button.clicked.connect(self.start)
+
+    def fill_ports(self):
+        checked = self.selected_ports()
+        known = [self.portList.item(i).data(Qt.UserRole) for i in range(self.portList.count())]
+
+        self.portList.clear()
+
+        for port, version in port_registry.ports():
+            item = QListWidgetItem(port if version is None else port + "  [" + version + "]")
+            item.setData(Qt.UserRole, port)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+
+            # new sensors are selected, ports that are not sensors are not
+            if port in known:
+                item.setCheckState(Qt.Checked if port in checked else Qt.Unchecked)
+
+            else:
+                item.setCheckState(Qt.Checked if version is not None else Qt.Unchecked)
+
+            self.portList.addItem(item)
+
+    def selected_ports(self):
+        return [self.portList.item(i).data(Qt.UserRole) for i in range(self.portList.count())
+                if self.portList.item(i).checkState() == Qt.Checked]
+
+    def start(self):
+        profile = load_profiles().get(self.profileBox.currentText())
+        ports = self.selected_ports()
+
+        if profile is None or not ports or self.workers:
+            return
+
+        self.start_button.setEnabled(False)
+        self.table.setRowCount(len(ports))
+        self.summary_label.setText("")
+        self.start_time = time.monotonic()
+
+        for row, port in enumerate(ports):
+            self.rows[port] = row
+            self.table.setItem(row, 0, QTableWidgetItem(port))
+            for column in range(1, 6):
+                self.table.setItem(row, column, QTableWidgetItem(""))
+
+            # one worker (and one port reader) per device, all running at once
+            worker = FleetWorker(port, profile, self.checkBox_changed.isChecked())
+            worker.progress.connect(self.port_progress)
+            worker.port_done.connect(self.port_done)
+            self.workers[port] = worker
+            worker.start()
+
+    def port_progress(self, port, message):
+        self.table.item(self.rows[port], 1).setText(message)
+
+    def port_done(self, port, summary):
+        row = self.rows[port]
+        self.table.item(row, 1).setText("done")
+        self.table.item(row, 2).setText(str(summary["attempts"]))
+        self.table.item(row, 3).setText("%.2f" % summary["time"])
+        self.table.item(row, 4).setText("OK" if summary["readback"] else "-")
+        self.table.item(row, 5).setText("OK" if summary["ok"] and summary["readback"] else "FAILED " + summary["message"])
+
+        self.workers.pop(port).wait()
+
+        if not self.workers:
+            ok = sum(1 for row in range(self.table.rowCount()) if self.table.item(row, 5).text() == "OK")
+            self.summary_label.setText(str(ok) + " / " + str(self.table.rowCount()) + " sensors programmed in "
+                                       + "%.2f" % (time.monotonic() - self.start_time) + " s")
+            self.start_button.setEnabled(True)
+            self.rows = {}
+
+'''
+----------   Port registry   ----------
+'''
+
+PORT_POLL_INTERVAL = 2.0 # [s]
+PROBE_WORKERS = 8
+VERSION_PATTERN = re.compile(br'IR Switch Version: (\S+)')
+
+
+def probe_port(port, timeout=COMMAND_TIMEOUT):
+    """IR_SW_INFO handshake; firmware version of the sensor or None.
+
+    Raises serial.SerialException when the port can not be opened (busy).
+    """
+    replies = data_bus.subscribe(port, "lines")
+
+    try:
+        line = data_bus.request(replies, b'IR_SW_INFO', timeout)
+
+    finally:
+        data_bus.unsubscribe(replies)
+
+    match = VERSION_PATTERN.search(line)
+
+    return match.group(1).decode("ascii", "replace") if match else None
+
+
+class PortRegistry(QThread):
+    """Cached port list, watched for hot-plug and probed in parallel."""
+    ports_changed = pyqtSignal()
+    probed = pyqtSignal(str, object, bool) # port, verzija, zaseden
+
+    def __init__(self):
+        super(PortRegistry, self).__init__()
+
+        self.lock = threading.Lock()
+        self.versions = collections.OrderedDict() # port: verzija (None = ni senzor)
+        self.busy = set() # porti, ki jih ni bilo mogoce odpreti - ponovimo
+        self.requested = set() # Test connection
+        self.scanned = False
+        self.kill_thread = 0
+
+    def stop(self):
+        self.kill_thread = 1
+        self.wait()
+
+    def ports(self):
+        """[(port, version)], verified sensors first."""
+        if not self.scanned:
+            self.enumerate()
+
+        with self.lock:
+            items = list(self.versions.items())
+
+        return sorted(items, key=lambda item: item[1] is None)
+
+    def version(self, port):
+        with self.lock:
+            return self.versions.get(port)
+
+    def enumerate(self):
+        """Refresh the port list; returns the ports that were not known yet."""
+        found = [info.device for info in list_ports.comports()]
+
+        with self.lock:
+            new = [port for port in found if port not in self.versions]
+            removed = [port for port in self.versions if port not in found]
+
+            for port in removed:
+                del self.versions[port]
+                self.busy.discard(port)
+
+            for port in new:
+                self.versions[port] = None
+
+            self.scanned = True
+
+        return new, bool(new or removed)
+
+    @staticmethod
+    def probe_one(port):
+        try:
+            return probe_port(port), False
+
+        except serial.SerialException:
+            return None, True
+
+    def probe(self, ports):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+            results = list(pool.map(self.probe_one, ports))
+
+        with self.lock:
+            for port, (version, busy) in zip(ports, results):
+                if busy:
+                    self.busy.add(port) # zaseden port ni dokaz, da ni senzor
+
+                elif port in self.versions:
+                    self.busy.discard(port)
+                    self.versions[port] = version
+
+        for port, (version, busy) in zip(ports, results):
+            self.probed.emit(port, version, busy)
+
+        return results
+
+    def request_probe(self, port):
+        """Handshake port on the registry thread; the answer comes as probed."""
+        with self.lock:
+            self.requested.add(port)
+
+    def run(self):
+        while self.kill_thread == 0:
+            new, changed = self.enumerate()
+
+            if changed:
+                self.ports_changed.emit()
+
+            with self.lock:
+                retry = [port for port in self.requested | self.busy if port in self.versions and port not in new]
+                self.requested.clear()
+
+            if new or retry:
+                self.probe(new + retry)
+                self.ports_changed.emit()
+
+            deadline = time.monotonic() + PORT_POLL_INTERVAL
+            while self.kill_thread == 0 and time.monotonic() < deadline and not self.requested:
+                self.msleep(100)
+
+
+port_registry = PortRegistry()
+
+
+def fill_port_combo(combo, blank=" "):
+    """Fill combo with the registry's ports; item data is the port name."""
+    current = combo.currentData()
+
+    combo.clear()
+    combo.addItem(blank, blank)
+
+    for port, version in port_registry.ports():
+        if version is None:
+            combo.addItem(port, port)
+
+        else:
+            combo.addItem(port + "  [" + version + "]", port)
+
+    combo.setCurrentIndex(max(combo.findData(current), 0))
+
+
+def unwatch_ports(slot):
+    """Disconnect slot from ports_changed when its window closes."""
+    try:
+        port_registry.ports_changed.disconnect(slot)
+
+    except TypeError:
+        pass # ze odklopljen
+
+
+def combo_port(combo, index):
+    return combo.itemData(index)
+
+'''
+----------   Session capture   ----------
+'''
+
+CAPTURE_DIR = os.path.join(CONFIG_DIR, "captures")
+CAPTURE_INDEX_STEP = 256 # vrstic med tockami indeksa
+CAPTURE_INDEX_DTYPE = np.dtype([('t', '<f8'), ('o', '<i8')]) # cas in odmik vrstice v <datoteka>.idx
+CAPTURE_PART = re.compile(r'^(.+_\d{8}_\d{6})_(\d{3,})\.txt$') # <vrata>_<zacetek seje>_<del>.txt
+CAPTURE_PAGE = 500 # vrstic, ki jih rezultati nalozijo naenkrat
+CAPTURE_TIME_STYLE = "%Y-%m-%d %H:%M:%S"
+CAPTURE_STAMP_SIZE = 26 # "YYYY-mm-dd HH:MM:SS.ffffff"
+CAPTURE_MAX_SIZE = 32 * 1024 * 1024 # [B] nato seja nadaljuje v novi datoteki
+CAPTURE_BUDGET = 256 * 1024 * 1024 # [B] vsi zajemi skupaj, najstarejse brisemo
+
+
+def capture_enabled():
+    return load_json("capture.json", {}).get("enabled", True)
+
+
+def set_capture_enabled(enabled):
+    save_json("capture.json", {"enabled": bool(enabled)})
+
+
+def file_size(location):
+    return os.path.getsize(location) if os.path.exists(location) else 0
+
+
+def prune_captures(budget=CAPTURE_BUDGET):
+    """Delete the oldest capture files and their indexes until all fit in budget bytes."""
+    try:
+        names = [os.path.join(CAPTURE_DIR, name) for name in os.listdir(CAPTURE_DIR) if name.endswith(".txt")]
+
+    except OSError:
+        return
+
+    files = []
+    for location in names:
+        try:
+            status = os.stat(location)
+            size = status.st_size + file_size(location + ".idx")
+
+        except OSError:
+            continue
+
+        files.append((status.st_mtime, size, location))
+
+    files.sort()
+    total = sum(size for mtime, size, location in files)
+
+    for mtime, size, location in files:
+        if total <= budget:
+            break
+
+        try:
+            os.remove(location)
+            total -= size
+
+            if os.path.exists(location + ".idx"):
+                os.remove(location + ".idx")
+
+        except OSError:
+            pass
+
+
+def capture_parts(session):
+    """Part files of a session in order."""
+    directory, name = os.path.split(session)
+
+    try:
+        names = os.listdir(directory)
+
+    except OSError:
+        return []
+
+    parts = []
+    for part in names:
+        match = CAPTURE_PART.match(part)
+
+        if match and match.group(1) == name:
+            parts.append((int(match.group(2)), os.path.join(directory, part)))
+
+    return [location for number, location in sorted(parts)]
+
+
+def capture_sessions():
+    """Captured sessions, newest first."""
+    try:
+        names = os.listdir(CAPTURE_DIR)
+
+    except OSError:
+        return []
+
+    sessions = {}
+    for name in names:
+        match = CAPTURE_PART.match(name)
+
+        if match:
+            try:
+                changed = os.path.getmtime(os.path.join(CAPTURE_DIR, name))
+
+            except OSError:
+                continue
+
+            session = os.path.join(CAPTURE_DIR, match.group(1))
+            sessions[session] = max(sessions.get(session, 0.0), changed)
+
+    return sorted(sessions, key=sessions.get, reverse=True)
+
+
+def capture_stamps(stamps):
+    # cas z mikrosekundami, sekunde se formatirajo enkrat
+    stamps = np.asarray(stamps, dtype=np.float64)
+    micros = np.round((stamps - np.floor(stamps)) * 1e6).astype(np.int64).clip(0, 999999)
+
+    return [second + ".%06d" % micro for second, micro in zip(format_stamps(stamps, CAPTURE_TIME_STYLE), micros.tolist())]
+
+
+class CaptureFile(object):
+    """One append-only capture file with a sparse time index stored beside it.
+
+    Each line is "<local time with microseconds> <-|-> <text>".  Every
+    CAPTURE_INDEX_STEP lines the index stores the line's stamp and byte
+    offset, so a time range maps to a byte range without reading the file.
+    The index is kept in <file>.idx and rebuilt when it does not fit the file.
+    """
+
+    def __init__(self, location, writable=False):
+        self.location = location
+        self.size = file_size(location)
+        self.lines = 0
+        self.log = None
+        self.index = None
+
+        self.block_stamps = GrowableArray(np.float64)
+        self.block_offsets = GrowableArray(np.int64)
+
+        if self.size:
+            self.load_index()
+
+        if writable:
+            self.index = open(location + ".idx", 'ab')
+            self.log = open(location, 'ab')
+
+    def load_index(self):
+        location = self.location + ".idx"
+        stamps = offsets = None
+
+        with open(self.location, 'rb') as capture:
+            if file_size(location) % CAPTURE_INDEX_DTYPE.itemsize == 0:
+                points = np.fromfile(location, dtype=CAPTURE_INDEX_DTYPE) if os.path.exists(location) else []
+
+                if len(points) and points['o'][0] == 0 and points['o'][-1] < self.size:
+                    stamps, offsets = points['t'], points['o']
+
+            if offsets is not None:
+                # tocke se zapisejo pred vrsticami, zato jih po sesutju lahko kaze predalec
+                capture.seek(int(offsets[-1]))
+                tail = capture.read().count(b"\n")
+
+                if tail == 0 or tail > CAPTURE_INDEX_STEP:
+                    stamps = offsets = None
+
+            if offsets is None:
+                stamps, offsets = self.build_index(capture)
+                capture.seek(int(offsets[-1]) if len(offsets) else 0)
+                tail = capture.read().count(b"\n")
+
+                points = np.zeros(len(offsets), dtype=CAPTURE_INDEX_DTYPE)
+                points['t'] = stamps
+                points['o'] = offsets
+
+                try:
+                    with open(location, 'wb') as index:
+                        index.write(points.tobytes())
+
+                except OSError:
+                    pass # indeks v pomnilniku zadostuje za to odprtje
+
+        self.block_stamps.extend(np.asarray(stamps, dtype=np.float64))
+        self.block_offsets.extend(np.asarray(offsets, dtype=np.int64))
+        self.lines = CAPTURE_INDEX_STEP * max(len(offsets) - 1, 0) + tail
+
+    def build_index(self, capture):
+        stamps = []
+        offsets = GrowableArray(np.int64)
+        capture.seek(0)
+        position = 0
+        lines = 0
+        rest = b""
+
+        while True:
+            data = capture.read(LOG_CHUNK_SIZE)
+
+            if not data:
+                break
+
+            chunk = rest + data
+            base = position - len(rest)
+            position += len(data)
+            cut = chunk.rfind(b"\n") + 1
+            rest = chunk[cut:]
+
+            starts = self.match_lines(None, chunk[:cut])
+            picked = starts[(-lines) % CAPTURE_INDEX_STEP::CAPTURE_INDEX_STEP]
+
+            stamps += [self.line_stamp(chunk, start) for start in picked.tolist()]
+            offsets.extend(base + picked)
+            lines += len(starts)
+
+        return np.array(stamps, dtype=np.float64), offsets.array()
+
+    def full(self):
+        return self.size >= CAPTURE_MAX_SIZE
+
+    def append(self, stamps, direction, messages):
+        data = [(clock + " " + direction + " " + message + "\n").encode('utf8')
+                for clock, message in zip(capture_stamps(stamps), messages)]
+
+        ends = np.cumsum([len(line) for line in data])
+        starts = self.size + np.concatenate(([0], ends[:-1]))
+        first = (-self.lines) % CAPTURE_INDEX_STEP # prva vrstica v paketu, ki zacne blok
+
+        points = np.zeros(len(starts[first::CAPTURE_INDEX_STEP]), dtype=CAPTURE_INDEX_DTYPE)
+        points['t'] = stamps[first::CAPTURE_INDEX_STEP]
+        points['o'] = starts[first::CAPTURE_INDEX_STEP]
+
+        if len(points):
+            self.index.write(points.tobytes())
+            self.index.flush()
+
+        self.log.write(b"".join(data))
+        self.log.flush() # iskanje bere datoteko z drugim rocajem
+
+        self.block_stamps.extend(points['t'])
+        self.block_offsets.extend(points['o'])
+
+        self.size += int(ends[-1])
+        self.lines += len(data)
+
+    def close(self):
+        # indeks ostane v pomnilniku, iskanje po zaprti datoteki deluje naprej
+        for handle in (self.log, self.index):
+            if handle is not None:
+                handle.close()
+
+        self.log = self.index = None
+
+    def span(self, t0, t1):
+        """Byte range holding [t0, t1) and the inner range that needs no time check."""
+        stamps = self.block_stamps.view()
+        offsets = np.append(self.block_offsets.view(), self.size)
+
+        i0 = max(np.searchsorted(stamps, t0, 'left') - 1, 0)
+        i1 = np.searchsorted(stamps, t1, 'left')
+
+        # bloki med inner_start in inner_end so v celoti znotraj obmocja
+        inner0 = np.searchsorted(stamps, t0, 'left')
+        inner1 = max(np.searchsorted(stamps, t1, 'left') - 1, inner0)
+
+        return int(offsets[i0]), int(offsets[i1]), int(offsets[inner0]), int(offsets[inner1])
+
+    def search(self, regex=None, t0=None, t1=None):
+        """Byte offsets of the lines matching a compiled regex and/or a time range."""
+        if t0 is None and t1 is None:
+            start, end = 0, self.size
+            inner_start, inner_end = 0, self.size
+
+        else:
+            t0 = -np.inf if t0 is None else t0
+            t1 = np.inf if t1 is None else t1
+            start, end, inner_start, inner_end = self.span(t0, t1)
+
+        found = GrowableArray(np.int64)
+
+        with open(self.location, 'rb') as capture:
+            capture.seek(start)
+            position = start
+            rest = b""
+
+            while position < end:
+                chunk = rest + capture.read(min(LOG_CHUNK_SIZE, end - position))
+                position = capture.tell()
+                cut = chunk.rfind(b"\n") + 1
+                rest = chunk[cut:]
+                base = position - len(chunk)
+
+                offsets = base + self.match_lines(regex, chunk[:cut])
+
+                # casovno preverimo le vrstice v robnih blokih
+                edge = (offsets < inner_start) | (offsets >= inner_end)
+                if t0 is not None and np.any(edge):
+                    keep = [t0 <= self.line_stamp(chunk, offset - base) < t1 if outside else True
+                            for offset, outside in zip(offsets.tolist(), edge.tolist())]
+                    offsets = offsets[np.array(keep, dtype=bool)]
+
+                found.extend(offsets)
+
+        return found.array()
+
+    @staticmethod
+    def match_lines(regex, chunk):
+        if not chunk:
+            return np.zeros(0, dtype=np.int64)
+
+        if regex is None:
+            return np.concatenate(([0], np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)[:-1] + 1))
+
+        starts = []
+        position = 0
+
+        while True:
+            match = regex.search(chunk, position)
+
+            if match is None:
+                break
+
+            line = chunk.rfind(b"\n", 0, match.start()) + 1
+            starts.append(line)
+            position = chunk.find(b"\n", max(match.end() - 1, line)) + 1 # naslednja vrstica
+
+            if position == 0:
+                break
+
+        return np.array(starts, dtype=np.int64)
+
+    @staticmethod
+    def line_stamp(chunk, offset):
+        stamp = chunk[offset:offset + CAPTURE_STAMP_SIZE].decode('ascii', 'replace')
+
+        try:
+            return time.mktime(dt.strptime(stamp, CAPTURE_TIME_STYLE + ".%f").timetuple()) + int(stamp[-6:]) / 1e6
+
+        except ValueError:
+            return -np.inf
+
+    def read_lines(self, offsets):
+        with open(self.location, 'rb') as capture:
+            lines = []
+
+            for offset in offsets:
+                capture.seek(offset)
+                lines.append(capture.readline().rstrip(b"\n").decode('utf8', 'replace'))
+
+        return lines
+
+
+class SessionCapture(object):
+    """Capture of one console session, split into CAPTURE_MAX_SIZE files.
+
+    Lines are stamped when appended, so stamps never decrease across the
+    parts.  Search covers every part that is still on disk.
+    """
+
+    def __init__(self, session, writable=False):
+        self.session = session
+        self.writable = writable
+        self.last_stamp = 0.0
+        self.parts = [CaptureFile(location) for location in capture_parts(session)]
+
+        if writable:
+            self.parts.append(CaptureFile(self.part_location(len(self.parts)), True))
+
+    @classmethod
+    def new(cls, port):
+        os.makedirs(CAPTURE_DIR, exist_ok=True)
+        prune_captures(CAPTURE_BUDGET - CAPTURE_MAX_SIZE) # prostor za novo datoteko
+        name = re.sub(r'[^\w.-]', '_', port) + "_" + dt.now().strftime("%Y%m%d_%H%M%S")
+
+        return cls(os.path.join(CAPTURE_DIR, name), True)
+
+    @property
+    def lines(self):
+        return sum(part.lines for part in self.parts)
+
+    def part_location(self, number):
+        return self.session + "_%03d.txt" % number
+
+    def append(self, direction, messages):
+        if not messages:
+            return
+
+        if self.parts[-1].full():
+            self.parts[-1].close()
+            prune_captures(CAPTURE_BUDGET - CAPTURE_MAX_SIZE)
+            self.parts.append(CaptureFile(self.part_location(len(self.parts)), True))
+
+        # ena ura za obe smeri; ob premiku ure nazaj ostane zadnji cas
+        self.last_stamp = max(time.time(), self.last_stamp)
+        self.parts[-1].append(np.full(len(messages), self.last_stamp), direction, messages)
+
+    def close(self):
+        if self.writable:
+            self.writable = False
+            self.parts[-1].close()
+
+    def search(self, pattern=None, t0=None, t1=None):
+        """(part, byte offset) rows of the lines matching a regex and/or a time range."""
+        regex = None if pattern is None else re.compile(pattern.encode('utf8'), re.MULTILINE)
+        found = [np.zeros((0, 2), dtype=np.int64)]
+
+        for number, part in enumerate(self.parts):
+            if not os.path.exists(part.location):
+                continue # pobrisano zaradi omejitve prostora
+
+            offsets = part.search(regex, t0, t1)
+            found.append(np.column_stack((np.full(len(offsets), number, dtype=np.int64), offsets)))
+
+        return np.concatenate(found)
+
+    def read_lines(self, rows):
+        lines = []
+        start = 0
+
+        # zaporedne vrstice istega dela preberemo z enim odprtjem
+        while start < len(rows):
+            number = rows[start, 0]
+            end = start + int(np.argmax(np.append(rows[start:, 0] != number, True)))
+
+            try:
+                lines += self.parts[number].read_lines(rows[start:end, 1].tolist())
+
+            except OSError as error:
+                lines += ["(" + str(error) + ")"] * (end - start)
+
+            start = end
+
+        return lines
+
+
+class CaptureResults(QAbstractListModel):
+    """Search results that read their lines from the capture only when shown."""
+
+    def __init__(self, capture, rows):
+        super(CaptureResults, self).__init__()
+
+        self.capture = capture
+        self.rows = rows
+        self.loaded = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return len(self.loaded)
+
+    def canFetchMore(self, parent):
+        return len(self.loaded) < len(self.rows)
+
+    def fetchMore(self, parent):
+        count = min(CAPTURE_PAGE, len(self.rows) - len(self.loaded))
+
+        self.beginInsertRows(QModelIndex(), len(self.loaded), len(self.loaded) + count - 1)
+        self.loaded += self.capture.read_lines(self.rows[len(self.loaded):len(self.loaded) + count])
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.loaded[index.row()]
+
+        return None
+
+'''
+----------  Debug window  ----------
+'''
+
+DEBUG_MAX_LINES = 20000 # privzeta dolzina zgodovine konzole
+DEBUG_BATCH_INTERVAL = 50 # ms med dodajanji v konzolo
+DEBUG_TIME_STYLE = "%d.%m.%Y %H:%M"
+
+
+class DebugWindow(QWidget):
+    def __init__(self):
+        super(DebugWindow, self).__init__()
+        self.serial_on = serial_on
+        self.capture = None
+        self.setupUi(self)
+
+        self.sent_format = QTextCharFormat()
+        self.sent_format.setForeground(QBrush(Qt.blue))
+        self.received_format = QTextCharFormat()
+        self.received_format.setForeground(QBrush(Qt.red))
+        self.pass_format = QTextCharFormat()
+        self.pass_format.setForeground(QBrush(Qt.darkGreen))
+        self.fail_format = QTextCharFormat()
+        self.fail_format.setForeground(QBrush(Qt.darkMagenta))
+
+        self.engine = None
+        self.raw = None
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll)
+
+    def closeEvent(self, event):
+        unwatch_ports(self.fill_ports)
+        self.debug_exit()
+
+    def setupUi(self, Debug_window):
+        Debug_window.setObjectName("Debug_window")
+        Debug_window.resize(643, 577)
+        Debug_window.setWindowTitle("Debug")
+
+        textEdit_font = QFont()
+        textEdit_font.setPointSize(14)
+        self.textEdit = QPlainTextEdit(Debug_window)
+        self.textEdit.setGeometry(QRect(30, 20, 891, 701))
+        self.textEdit.setFont(textEdit_font)
+        self.textEdit.setUndoRedoEnabled(False) # sicer zgodovina razveljavitev raste brez meje
+        self.textEdit.setMaximumBlockCount(DEBUG_MAX_LINES)
+
+        comboBox_font = QFont()
+        comboBox_font.setPointSize(14)
+        self.comboBox = QComboBox(Debug_window)
+        self.comboBox.setGeometry(QRect(30, 730, 140, 30))
+
+        self.comboBox.setFrame(False)
+        fill_port_combo(self.comboBox)
+        port_registry.ports_changed.connect(self.fill_ports)
+
+        self.comboBox.setFont(comboBox_font)
+
+        lineEdit_font = QFont()
+        lineEdit_font.setPointSize(14)
+        self.lineEdit = QLineEdit(Debug_window)
+        self.lineEdit.setGeometry(QRect(180, 730, 540, 30))
+        self.lineEdit.setFont(lineEdit_font)
+
+        send_font = QFont()
+        send_font.setPointSize(16)
+        self.send_button = QPushButton(Debug_window)
+        self.send_button.setGeometry(QRect(730, 730, 100, 30))
+        self.send_button.setText("Send")
+        self.send_button.setFont(send_font)
+
+        self.lines_box = QSpinBox(Debug_window)
+        self.lines_box.setGeometry(QRect(840, 730, 110, 30))
+        self.lines_box.setRange(100, 1000000)
+        self.lines_box.setSingleStep(1000)
+        self.lines_box.setSuffix(" lines")
+        self.lines_box.setValue(DEBUG_MAX_LINES)
+        self.lines_box.setToolTip("Scrollback length")
+
+        self.script_button = QPushButton(Debug_window)
+        self.script_button.setGeometry(QRect(960, 730, 100, 30))
+        self.script_button.setText("Script...")
+        self.script_button.setToolTip("Run a command script from a file")
+
+        self.run_line_button = QPushButton(Debug_window)
+        self.run_line_button.setGeometry(QRect(1070, 730, 100, 30))
+        self.run_line_button.setText("Run line")
+        self.run_line_button.setToolTip("Run the typed line as a script, commands separated by ';'")
+
+        self.stop_button = QPushButton(Debug_window)
+        self.stop_button.setGeometry(QRect(1180, 730, 60, 30))
+        self.stop_button.setText("Stop")
+        self.stop_button.setEnabled(False)
+
+        self.script_label = QLabel(Debug_window)
+        self.script_label.setGeometry(QRect(1250, 730, 100, 30))
+
+        # surovi bajti v hex pogledu
+        self.hex_view = QPlainTextEdit(Debug_window)
+        self.hex_view.setGeometry(QRect(30, 20, 891, 701))
+        self.hex_view.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.hex_view.setReadOnly(True)
+        self.hex_view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.hex_view.hide()
+
+        self.raw_check = QCheckBox(Debug_window)
+        self.raw_check.setGeometry(QRect(30, 770, 60, 30))
+        self.raw_check.setText("raw")
+        self.raw_check.setToolTip("Hex view of the raw received bytes")
+
+        self.prev_button = QPushButton(Debug_window)
+        self.prev_button.setGeometry(QRect(100, 770, 60, 30))
+        self.prev_button.setText("<")
+
+        self.page_box = QSpinBox(Debug_window)
+        self.page_box.setGeometry(QRect(170, 770, 120, 30))
+        self.page_box.setPrefix("page ")
+        self.page_box.setRange(0, 0)
+
+        self.next_button = QPushButton(Debug_window)
+        self.next_button.setGeometry(QRect(300, 770, 60, 30))
+        self.next_button.setText(">")
+
+        self.follow_check = QCheckBox(Debug_window)
+        self.follow_check.setGeometry(QRect(370, 770, 80, 30))
+        self.follow_check.setText("follow")
+        self.follow_check.setChecked(True)
+
+        self.hex_label = QLabel(Debug_window)
+        self.hex_label.setGeometry(QRect(460, 770, 460, 30))
+
+        # iskanje po zajemu seje
+        self.search_box = QGroupBox(Debug_window)
+        self.search_box.setGeometry(QRect(930, 15, 420, 705))
+        self.search_box.setTitle("Capture search:")
+
+        self.pattern_edit = QLineEdit(self.search_box)
+        self.pattern_edit.setGeometry(QRect(10, 25, 400, 25))
+        self.pattern_edit.setPlaceholderText("regex, e.g. -> .*ERROR")
+
+        self.time_check = QCheckBox(self.search_box)
+        self.time_check.setGeometry(QRect(10, 55, 60, 25))
+        self.time_check.setText("time")
+
+        self.from_edit = QDateTimeEdit(QDateTime.currentDateTime(), self.search_box)
+        self.from_edit.setGeometry(QRect(70, 55, 165, 25))
+        self.from_edit.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+
+        self.to_edit = QDateTimeEdit(QDateTime.currentDateTime().addSecs(3600), self.search_box)
+        self.to_edit.setGeometry(QRect(245, 55, 165, 25))
+        self.to_edit.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+
+        self.search_button = QPushButton(self.search_box)
+        self.search_button.setGeometry(QRect(10, 85, 80, 25))
+        self.search_button.setText("Search")
+
+        self.search_label = QLabel(self.search_box)
+        self.search_label.setGeometry(QRect(100, 85, 310, 25))
+
+        self.results_view = QListView(self.search_box)
+        self.results_view.setGeometry(QRect(10, 115, 400, 520))
+        self.results_view.setUniformItemSizes(True)
+
+        self.session_box = QComboBox(self.search_box)
+        self.session_box.setGeometry(QRect(10, 640, 400, 25))
+        self.list_sessions()
+
+        self.capture_check = QCheckBox(self.search_box)
+        self.capture_check.setGeometry(QRect(10, 670, 400, 25))
+        self.capture_check.setText("Capture session to disk (" + str(CAPTURE_BUDGET // (1024 * 1024)) + " MB max)")
+        self.capture_check.setChecked(capture_enabled())
+
+        self.retranslateUi(Debug_window)
+        QMetaObject.connectSlotsByName(Debug_window)
+
+    def retranslateUi(self, Debug_window):
+        self.send_button.clicked.connect(self.send)
+        self.comboBox.activated[int].connect(lambda index: self.serial_port_select(combo_port(self.comboBox, index)))
+        self.lines_box.valueChanged.connect(self.textEdit.setMaximumBlockCount)
+        self.search_button.clicked.connect(self.search)
+        self.capture_check.toggled.connect(self.capture_select)
+        self.script_button.clicked.connect(self.open_script)
+        self.run_line_button.clicked.connect(lambda: self.run_script(self.lineEdit.text()))
+        self.stop_button.clicked.connect(self.stop_script)
+        self.raw_check.stateChanged.connect(self.raw_select)
+        self.prev_button.clicked.connect(lambda: self.step_page(-1))
+        self.next_button.clicked.connect(lambda: self.step_page(1))
+        self.page_box.valueChanged.connect(self.show_page)
+        self.pattern_edit.returnPressed.connect(self.search)
+
+    def fill_ports(self):
+        fill_port_combo(self.comboBox)
+
+    def serial_port_select(self, text):
+        self.debug_exit()
+
+        self.port = text
+
+        if text != " ":
+            try:
+                self.messages = data_bus.subscribe(self.port, "lines", 10000)
+
+            except serial.SerialException as error:
+                port_error(self, error)
+                self.comboBox.setCurrentIndex(0)
+                return
+
+            # rocni ukazi lahko spremenijo nastavitve mimo profilov
+            forget_device_state(self.port)
+
+            self.start_capture()
+
+            self.poll_timer.start(DEBUG_BATCH_INTERVAL)
+
+            self.serial_on = 1
+            self.raw_select()
+
+    def send(self):
+        command = self.lineEdit.text()
+
+        if command == "clr":
+            self.textEdit.clear()
+
+        elif self.engine is not None:
+            return # med skripto rocno ne posiljamo
+
+        else:
+            try:
+                data_bus.write(self.port, command.encode('ascii'))
+
+            except serial.SerialException as error:
+                port_error(self, error)
+                return
+
+            self.append_lines([time.time()], [command], '<- ', self.sent_format)
+
+    def open_script(self):
+        location = QFileDialog.getOpenFileName(self, "Run script", "", "Script files (*.txt *.script)")[0]
+
+        if location != '':
+            try:
+                with open(location, 'r', encoding='utf8') as script:
+                    self.run_script(script.read())
+
+            except OSError as error:
+                self.script_label.setText(str(error))
+
+    def run_script(self, text):
+        if self.serial_on != 1 or (self.engine is not None and self.engine.isRunning()):
+            self.script_label.setText("Select a port and wait for the running script.")
+            return
+
+        try:
+            commands = parse_script(text)
+
+        except ValueError as error:
+            self.script_label.setText(str(error))
+            return
+
+        self.script_replies = data_bus.subscribe(self.port, "lines", 1000)
+        forget_device_state(self.port) # skripta lahko spremeni nastavitve
+
+        self.engine = CommandEngine(self.script_replies, commands)
+        self.engine.command_done.connect(self.script_step)
+        self.engine.batch_done.connect(self.script_done)
+        self.script_started = time.monotonic()
+        self.engine.start()
+        self.script_running(True)
+
+        self.script_label.setText("Running " + str(len(commands)) + " commands...")
+
+    def script_step(self, result):
+        command = result.command.command.decode('ascii', 'replace')
+        reply = result.reply.decode('utf8', 'replace') if result.reply else "(no reply)"
+        latency = "%.1f ms" % (result.latency * 1000)
+
+        if result.ok:
+            self.append_lines([time.time()], ["PASS " + command + " " + latency + ": " + reply], '## ', self.pass_format)
+
+        else:
+            self.append_lines([time.time()], ["FAIL " + command + " " + latency + ": " + reply], '## ', self.fail_format)
+
+    def script_running(self, running):
+        # rocni ukazi bi se pomesali z odgovori skripte
+        for widget in (self.lineEdit, self.send_button, self.script_button, self.run_line_button):
+            widget.setEnabled(not running)
+
+        self.stop_button.setEnabled(running)
+
+    def stop_script(self):
+        if self.engine is not None:
+            self.engine.cancel()
+            self.script_label.setText("Stopping...")
+
+    def script_done(self, results):
+        data_bus.unsubscribe(self.script_replies)
+        self.engine.wait() # batch_done je zadnje, kar nit naredi
+        self.engine = None
+        self.script_running(False)
+
+        passed = len([result for result in results if result.ok])
+        total = time.monotonic() - self.script_started
+
+        self.script_label.setText(str(passed) + "/" + str(len(results)) + " passed in " + "%.0f ms" % (total * 1000))
+
+    def start_capture(self):
+        self.stop_capture()
+
+        if self.capture_check.isChecked():
+            try:
+                self.capture = SessionCapture.new(self.port)
+
+            except OSError as error:
+                self.search_label.setText("No capture: " + str(error))
+
+        self.list_sessions()
+
+    def stop_capture(self):
+        if self.capture is not None:
+            try:
+                self.capture.close()
+
+            except OSError:
+                pass
+
+        self.capture = None
+
+    def list_sessions(self):
+        """Fills the session choice: the running capture first, then the ones on disk."""
+        current = self.capture.session if self.capture is not None else None
+
+        self.session_box.clear()
+        if current is not None:
+            self.session_box.addItem("current session (" + os.path.basename(current) + ")", current)
+
+        for session in capture_sessions():
+            if session != current:
+                self.session_box.addItem(os.path.basename(session), session)
+
+    def capture_select(self, enabled):
+        set_capture_enabled(enabled)
+
+        if self.serial_on == 1:
+            self.start_capture()
+
+    def append_lines(self, stamps, messages, direction, text_format):
+        """Appends a batch of lines in one edit block, one block per line."""
+        if self.capture is not None and self.serial_on == 1:
+            try:
+                self.capture.append(direction.strip(), messages)
+
+            except OSError as error:
+                # poln disk ali pravice: konzola tece naprej brez zajema
+                self.stop_capture()
+                self.list_sessions()
+                self.search_label.setText("Capture stopped: " + str(error))
+
+        scroll = self.textEdit.verticalScrollBar()
+        at_bottom = scroll.value() == scroll.maximum()
+
+        cursor = QTextCursor(self.textEdit.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+
+        empty = self.textEdit.document().isEmpty()
+
+        for clock, message in zip(format_stamps(np.array(stamps), DEBUG_TIME_STYLE), messages):
+            if not empty:
+                cursor.insertBlock()
+
+            cursor.insertText(clock + direction + message, text_format)
+            empty = False
+
+        cursor.endEditBlock()
+
+        if at_bottom:
+            scroll.setValue(scroll.maximum())
+
+    def debug_exit(self):
+        if self.engine is not None:
+            self.engine.cancel() # script_done se javi, ko se nit konca
+
+        if self.serial_on == 1:
+            if self.raw is not None:
+                data_bus.capture_raw(self.port, None)
+                self.raw = None
+
+            self.serial_on = 0
+            self.poll_timer.stop()
+            data_bus.unsubscribe(self.messages)
+
+            self.stop_capture()
+            self.list_sessions()
+
+    def search(self):
+        session = self.session_box.currentData()
+
+        if session is None:
+            self.search_label.setText("No capture, select a port and enable capture.")
+            return
+
+        if self.capture is not None and self.capture.session == session:
+            capture = self.capture
+
+        else:
+            try:
+                capture = SessionCapture(session)
+
+            except OSError as error:
+                self.search_label.setText("Cannot open capture: " + str(error))
+                return
+
+        pattern = self.pattern_edit.text() or None
+        t0 = t1 = None
+
+        if self.time_check.isChecked():
+            t0 = self.from_edit.dateTime().toMSecsSinceEpoch() / 1000.0
+            t1 = self.to_edit.dateTime().toMSecsSinceEpoch() / 1000.0
+
+        try:
+            rows = capture.search(pattern, t0, t1)
+
+        except re.error as error:
+            self.search_label.setText("Bad regex: " + str(error))
+            return
+
+        except OSError as error:
+            self.search_label.setText("Cannot read capture: " + str(error))
+            return
+
+        self.results = CaptureResults(capture, rows)
+        self.results_view.setModel(self.results)
+        self.search_label.setText(str(len(rows)) + " of " + str(capture.lines) + " lines in " + str(len(capture.parts)) + " files")
+
+    def raw_select(self):
+        raw = self.raw_check.isChecked()
+
+        self.textEdit.setVisible(not raw)
+        self.hex_view.setVisible(raw)
+
+        if raw and self.serial_on == 1 and self.raw is None:
+            self.raw = ByteRing()
+            data_bus.capture_raw(self.port, self.raw)
+
+        elif not raw and self.raw is not None:
+            if self.serial_on == 1:
+                data_bus.capture_raw(self.port, None)
+
+            self.raw = None
+
+        self.show_page(self.page_box.value())
+
+    def step_page(self, step):
+        self.follow_check.setChecked(False) # rocno listanje ustavi sledenje
+        self.show_page(self.page_box.value() + step)
+
+    def show_page(self, page):
+        if self.raw is None:
+            self.hex_view.clear()
+            self.hex_label.setText("")
+            return
+
+        first = self.raw.first() // HEX_PAGE
+        last = max(self.raw.total - 1, 0) // HEX_PAGE
+        page = min(max(page, first), last)
+
+        # sprememba strani brez ponovnega klica show_page
+        self.page_box.blockSignals(True)
+        self.page_box.setRange(first, last)
+        self.page_box.setValue(page)
+        self.page_box.blockSignals(False)
+
+        start, data = self.raw.read(page * HEX_PAGE, (page + 1) * HEX_PAGE)
+        self.hex_view.setPlainText(hex_dump(data, start))
+
+        self.hex_label.setText(str(self.raw.total) + " bytes received, pages " + str(first) + "-" + str(last))
+
+    def poll(self):
+        if self.raw is not None and self.follow_check.isChecked():
+            self.show_page(self.raw.total // HEX_PAGE)
+
+        received = self.messages.get_all()
+
+        if received:
+            stamps, lines = zip(*received)
+            self.append_lines(stamps, [line.decode("utf-8", "replace") for line in lines], '-> ', self.received_format)
+
+        if self.messages.error is not None:
+            self.append_lines([time.time()], ["port disconnected: " + self.messages.error], '## ', self.fail_format)
+            self.debug_exit()
+
+            self.port = " "
+            self.comboBox.setCurrentIndex(0)
+
+
+'''
+----------   Calibrate Sensor   ----------
+'''
+
+
+class CalibrateSensor(QWidget):
+    def __init__(self):
+        super(CalibrateSensor, self).__init__()
+
+        self.port = " "
+        self.serial_selected = 0
+
+        self.setWindowTitle('Sensor calibration')
+        self.resize(350, 80)
+        self.move(100, 200)
+
+        self.progressbar = QProgressBar()
+        self.progressbar.reset()  # resets the progress bar
+        self.progressbar.setAlignment(Qt.AlignCenter)  # centers the text
+        self.progressbar.setFormat('%p%')
+        self.progressbar.valueChanged.connect(self.progress_changed)
+
+        self.btn_close = QPushButton('Close')
+        self.btn_close.clicked.connect(self.close)
+
+        self.comboBox = QComboBox()
+        fill_port_combo(self.comboBox)
+        port_registry.ports_changed.connect(self.fill_ports)
+
+        self.comboBox.activated[int].connect(lambda index: self.serial_port_select(combo_port(self.comboBox, index)))
+
+        # timer
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.progress_simulation)
+
+        self.palette = QPalette(self.palette())
+
+        # vertical layout
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.comboBox)
+        hbox.addSpacing(110)
+        hbox.addWidget(self.btn_close)
+        hbox.addSpacing(5)
+
+        vbox = QVBoxLayout()
+        vbox.addWidget(self.progressbar)
+        vbox.addStretch(1)
+        vbox.addLayout(hbox)
+        self.setLayout(vbox)
+
+        self.show()
+
+    def fill_ports(self):
+        fill_port_combo(self.comboBox)
+
+    def serial_port_select(self, port):
+        self.port = port
+
+        if self.serial_selected == 1:
+            self.serial_selected = 0
+            serial_manager.release(self.link.port, self)
+
+        if self.port != " ":
+            try:
+                self.link = serial_manager.acquire(self.port, self, exclusive=True)
+
+            except serial.SerialException as error:
+                port_error(self, error)
+                self.comboBox.setCurrentIndex(0)
+                return
+
+            self.serial_selected = 1
+
+            self.calibrate_sensor()
+
+    def closeEvent(self, event):
+        unwatch_ports(self.fill_ports)
+
+        if self.serial_selected == 1:
+            self.serial_selected = 0
+            serial_manager.release(self.link.port, self)
+
+    def calibrate_sensor(self):
+        forget_device_state(self.port) # ukaz mimo profilov
+        line = self.link.request(b'CALIBRATE1')  # read a '\n' terminated line
+
+        if line == b'Izvaja se ADC kalibracijski proces senzorja!':
+
+            self.complite = 0
+            self.start()
+
+        elif line != b'Izvaja se ADC kalibracijski proces senzorja!':
+            self.fail()
+
+        self.setPalette(self.palette)
+
+    def progress_simulation(self):
+        self.value = self.progressbar.value()  # gets the current value of the progress bar
+        self.progressbar.setValue(self.value + 1)  # adds 1 to the current value
+
+    def fail(self):
+        self.var_fail = 1
+        self.timer.start(8)  # interval of 200 milliseconds
+        self.palette.setColor(QPalette.Highlight, QColor(Qt.red))
+
+    def start(self):
+        self.var_fail = 0
+        self.timer.start(75)  # interval of 200 milliseconds
+        self.palette.setColor(QPalette.Highlight, QColor(Qt.blue))
+
+    def progress_changed(self, value):
+        if self.var_fail == 0:
+            line = self.link.read_reply(0)  # ne caka na odgovor
+
+            if line == b'Kalibracijski proces uspesno zakljucen':
+                self.palette.setColor(QPalette.Highlight, QColor(Qt.green))
+                self.setPalette(self.palette)
+
+                self.timer.stop()
+                self.timer.start(1)
+
+                self.complite = 1
+
+            if self.complite == 0 and value == 98:
+                self.palette.setColor(QPalette.Highlight, QColor(Qt.red))
+                self.setPalette(self.palette)
+
+                self.progressbar.setFormat('Calibration Failed')
+                self.timer.stop()
+                self.timer.start(1)
+
+            if value == 99 and self.complite == 1:
+                self.progressbar.setFormat('Calibration Complete')
+                self.timer.stop()
+                self.timer.start(1)
+
+        elif self.var_fail == 1:
+            if value == 99:
+                self.progressbar.setFormat('Calibration Failed')
+                self.timer.stop()
+                self.timer.start(1)
+
+
+        if value == 100:
+                self.timer.stop
+                time.sleep(3)
+                self.close()
+
+'''
+----------   Ring buffer   ----------
+'''
+
+EPOCH_DATENUM = md.date2num(dt(1970, 1, 1))
+
+
+def utc_offset():
+    if time.daylight and time.localtime().tm_isdst > 0:
+        return -time.altzone
+
+    return -time.timezone
+
+
+def local_datenum(stamps):
+    # epoch sekunde -> matplotlib datum v lokalnem casu (kot dt.now())
+    return EPOCH_DATENUM + (np.asarray(stamps) + utc_offset()) / 86400.0
+
+
+class RingBuffer(object):
+    """Preallocated circular history of (timestamp, value) samples.
+
+    Every sample is written twice, at i and i + capacity, so the newest n
+    samples are always one contiguous slice and view() never copies.
+    """
+
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = capacity
+        self.t = np.zeros(2 * capacity, dtype=np.float64)
+        self.v = np.zeros(2 * capacity, dtype=dtype)
+        self.head = 0 # naslednje mesto za pisanje
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def append(self, stamp, value):
+        i = self.head
+        self.t[i] = self.t[i + self.capacity] = stamp
+        self.v[i] = self.v[i + self.capacity] = value
+
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def extend(self, stamps, values):
+        stamps = np.asarray(stamps, dtype=np.float64)[-self.capacity:]
+        values = np.asarray(values)[-self.capacity:]
+        n = len(stamps)
+
+        if n == 0:
+            return
+
+        index = (self.head + np.arange(n)) % self.capacity
+        self.t[index] = stamps
+        self.t[index + self.capacity] = stamps
+        self.v[index] = values
+        self.v[index + self.capacity] = values
+
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def view(self, n=None):
+        """Newest n samples in arrival order, as views into the buffer."""
+        if n is None or n > self.count:
+            n = self.count
+
+        start = (self.head - n) % self.capacity
+
+        return self.t[start:start + n], self.v[start:start + n]
+
+    def last(self):
+        if self.count == 0:
+            return None
+
+        i = (self.head - 1) % self.capacity
+
+        return self.t[i], self.v[i]
+
+'''
+----------   Live renderer   ----------
+'''
+
+
+class LiveRenderer(object):
+    """Persistent line on a fixed axes, redrawn with blitting."""
+
+    def __init__(self, figure, canvas):
+        self.figure = figure
+        self.canvas = canvas
+
+        self.ax = self.figure.add_subplot(1, 1, 1)
+        self.ax.set_autoscale_on(False)
+        self.ax.set_title("Izris trenutne vrednosti")
+        self.ax.set_xlabel('Čas [h:m:s]')  # x os label
+        self.ax.xaxis.set_major_formatter(md.DateFormatter('%H:%M:%S'))
+        self.ax.tick_params(axis='x', labelrotation=45)
+
+        # animated: the line is left out of full redraws and only blitted
+        self.line, = self.ax.plot([], [], animated=True)
+
+        self.background = None
+        self.ylabel = None
+        self.ylim = None
+
+        self.draw_cid = self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def close(self):
+        self.canvas.mpl_disconnect(self.draw_cid)
+        self.background = None
+
+    def on_draw(self, event):
+        # every full redraw (resize, zoom, new limits) refreshes the background
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def set_mode(self, ylabel, ylim):
+        if ylabel == self.ylabel and ylim == self.ylim:
+            return False
+
+        self.ylabel = ylabel
+        self.ylim = ylim
+        self.ax.set_ylabel(ylabel)  # y os label
+        self.ax.set_ylim(ylim)
+        self.background = None
+
+        return True
+
+    def update_limits(self, x):
+        """Move the x window only when the data leaves it, with some slack."""
+        x0, x1 = self.ax.get_xlim()
+
+        first = x[0]
+        last = x[-1]
+        span = max(last - first, 1.0 / 86400)  # vsaj ena sekunda
+
+        if first >= x0 and last <= x1 and x1 - x0 <= 1.5 * span:
+            return False
+
+        # 25 % headroom, so the limits (and ticks) change once per few samples
+        self.ax.set_xlim(first, first + 1.25 * span)
+
+        return True
+
+    def update(self, x, y):
+        self.line.set_data(x, y)
+
+        redraw = self.background is None
+        if len(x) > 0:
+            redraw = self.update_limits(x) or redraw
+
+        if redraw:
+            self.canvas.draw()
+
+        else:
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line)
+            self.canvas.blit(self.ax.bbox)
+
+'''
+----------   Render scheduler   ----------
+'''
+
+
+class RenderScheduler(QObject):
+    """Calls render() at a fixed frame rate, only when new samples arrived.
+
+    Samples are counted with notify() and coalesced into the next frame. If a
+    frame takes longer than the frame interval the following ticks are
+    skipped instead of piling up in the event loop.
+    """
+    stats_changed = pyqtSignal(float, float) # fps, vzorcev na sliko
+
+    def __init__(self, render, fps=25, parent=None):
+        super(RenderScheduler, self).__init__(parent)
+
+        self.render = render
+        self.pending = 0 # vzorci od zadnje slike
+        self.next_frame = 0.0
+        self.skipped = 0
+
+        self.frames = 0
+        self.samples = 0
+        self.stats_start = time.monotonic()
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        self.fps = max(1, fps)
+        self.interval = 1.0 / self.fps
+        self.timer.setInterval(int(1000 / self.fps))
+
+    def start(self):
+        self.pending = 0
+        self.next_frame = 0.0
+        self.stats_start = time.monotonic()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def notify(self, count=1):
+        self.pending += count
+
+    def tick(self):
+        now = time.monotonic()
+
+        if self.pending > 0:
+            if now < self.next_frame:
+                self.skipped += 1
+
+            else:
+                samples = self.pending
+                self.pending = 0
+
+                self.render()
+
+                cost = time.monotonic() - now
+                self.next_frame = now + max(self.interval, cost) - 0.001
+
+                self.frames += 1
+                self.samples += samples
+
+        elapsed = now - self.stats_start
+        if elapsed >= 1.0:
+            fps = self.frames / elapsed
+            per_frame = self.samples / self.frames if self.frames else 0.0
+            self.stats_changed.emit(fps, per_frame)
+
+            self.frames = 0
+            self.samples = 0
+            self.stats_start = now
+
+'''
+----------   Binary log   ----------
+'''
+
+BINARY_LOG = "binary"
+
+# (izbira v MplDrawGraph, strftime, locilo)
+LOG_STYLES = [
+    ("%Y-%d-%m %H:%M:%S , data", "%Y-%d-%m %H:%M:%S", " , "),
+    ("%H:%M:%S , data", "%H:%M:%S", " , "),
+    ("%d-%m %H:%M:%S , data", "%d-%m %H:%M:%S", " , "),
+    ("%d-%m-%H:%M:%S,data", "%d-%m-%H:%M:%S", ","),
+    ("%H:%M:%S,data", "%H:%M:%S", ","),
+    ("%H%M%S,data", "%H%M%S", ","),
+    ("binary (.bin)", BINARY_LOG, ""),
+]
+
+BINLOG_MAGIC = b'POSLOG\x00\x01'
+BINLOG_DTYPE = np.dtype([('t', '<i8'), ('v', '<f8')]) # lokalni cas [ns], vrednost
+BINLOG_ALIGN = 16
+
+
+def local_ns(stamps):
+    # epoch sekunde -> lokalni cas v ns (kot datetime64 brez casovnega pasu)
+    return np.round((np.asarray(stamps, dtype=np.float64) + utc_offset()) * 1e9).astype(np.int64)
+
+
+def binlog_header(title, x_label, y_label):
+    """Magic, uint32 length and JSON metadata, padded so records stay aligned."""
+    meta = json.dumps({"title": title, "x": x_label, "y": y_label}).encode('utf8')
+    pad = -(len(BINLOG_MAGIC) + 4 + len(meta)) % BINLOG_ALIGN
+
+    return BINLOG_MAGIC + struct.pack('<I', len(meta) + pad) + meta + b' ' * pad
+
+
+def binlog_records(times_ns, values):
+    records = np.empty(len(values), dtype=BINLOG_DTYPE)
+    records['t'] = times_ns
+    records['v'] = values
+
+    return records
+
+
+def is_binary_log(location):
+    with open(location, 'rb') as log:
+        return log.read(len(BINLOG_MAGIC)) == BINLOG_MAGIC
+
+
+def open_binary_log(location):
+    """(metadata, records); records are a read-only memmap, nothing is parsed."""
+    with open(location, 'rb') as log:
+        log.read(len(BINLOG_MAGIC))
+        length, = struct.unpack('<I', log.read(4))
+        meta = json.loads(log.read(length).decode('utf8'))
+
+    offset = len(BINLOG_MAGIC) + 4 + length
+    count = (os.path.getsize(location) - offset) // BINLOG_DTYPE.itemsize
+
+    if count == 0:
+        return meta, np.zeros(0, dtype=BINLOG_DTYPE)
+
+    return meta, np.memmap(location, dtype=BINLOG_DTYPE, mode='r', offset=offset, shape=(count,))
+
+
+def text_to_binary(source, target, progress=None):
+    with open(target, 'wb') as log:
+        for meta, layout, times, values, position, size in iter_text_log(source):
+            if log.tell() == 0:
+                log.write(binlog_header(meta["title"], meta["x"], meta["y"]))
+
+            log.write(binlog_records(times.astype('M8[ns]').astype(np.int64), values).tobytes())
+
+            if progress is not None and not progress(position, size):
+                raise LogReadCancelled(source)
+
+        if log.tell() == 0: # prazen log
+            log.write(binlog_header("", "", ""))
+
+
+def binary_to_text(source, target, style, separator, progress=None):
+    meta, records = open_binary_log(source)
+    step = LOG_CHUNK_SIZE // BINLOG_DTYPE.itemsize
+
+    # brez ".0" pri celih vrednostih
+    integral = all([np.all(records['v'][i:i + step] % 1 == 0) for i in range(0, len(records), step)])
+
+    with open(target, 'w', encoding='utf8') as log:
+        log.write("#TITLE = " + meta["title"] + "\n")
+        log.write("#X = " + meta["x"] + "\n")
+        log.write("#Y = " + meta["y"] + "\n")
+        log.write(LOG_SEPARATOR_LINE + "\n")
+
+        for i in range(0, len(records), step):
+            chunk = records[i:i + step]
+            times = chunk['t'].astype('M8[ns]').astype('M8[us]').tolist() # datetime
+            values = chunk['v'].astype(np.int64) if integral else chunk['v']
+
+            log.writelines([x.strftime(style) + separator + str(y) + "\n" for x, y in zip(times, values.tolist())])
+
+            if progress is not None and not progress(i + len(chunk), len(records)):
+                raise LogReadCancelled(source)
+
+'''
+----------   Log parser   ----------
+'''
+
+LOG_FIELD_WIDTH = {"Y": 4, "m": 2, "d": 2, "H": 2, "M": 2, "S": 2}
+LOG_STYLE_SAMPLE = 16 # st. vrstic za prepoznavo zapisa casa
+LOG_CHUNK_SIZE = 4 * 1024 * 1024 # bajtov na en kos pri branju
+
+
+def detect_style(stamp):
+    for label, style, separator in LOG_STYLES:
+        if style == BINARY_LOG:
+            continue
+
+        try:
+            dt.strptime(stamp, style)
+            return style
+
+        except ValueError:
+            pass
+
+    raise ValueError("Unknown log time format: " + stamp)
+
+
+def style_layout(style):
+    """Width of a formatted stamp, {field: column} and [(column, literal byte)]."""
+    fields = {}
+    literals = []
+    column = 0
+    i = 0
+
+    while i < len(style):
+        if style[i] == "%":
+            fields[style[i + 1]] = column
+            column += LOG_FIELD_WIDTH[style[i + 1]]
+            i += 2
+
+        else:
+            literals.append((column, ord(style[i])))
+            column += 1
+            i += 1
+
+    return column, fields, literals
+
+
+def detect_layout(lines):
+    """Style and value column from a sample of data lines."""
+    sample = [line.decode('ascii', 'replace') for line in lines[:LOG_STYLE_SAMPLE]]
+    style = detect_style(sample[0].rsplit(",", 1)[0].strip())
+
+    for line in sample[1:]:
+        if detect_style(line.rsplit(",", 1)[0].strip()) != style:
+            raise ValueError("Mixed log time formats")
+
+    width = style_layout(style)[0]
+    value_column = len(sample[0]) - len(sample[0][width:].lstrip(" ,"))
+
+    return style, value_column
+
+
+def split_log_lines(lines):
+    """Fixed width rows of data lines and a list of header (#) lines.
+
+    Rows are stripped; blank and whitespace-only lines are skipped.
+    """
+    rows = np.char.strip(np.array(lines, dtype=bytes))
+
+    if rows.itemsize == 0:
+        return rows, []
+
+    first = rows.view(np.uint8)[::rows.itemsize]
+    header = first == ord("#")
+    data = (first != ord("#")) & (rows != b"")
+
+    return rows[data], [line.decode('utf8', 'replace') for line in rows[header].tolist()]
+
+
+def parse_log_rows(rows, style, value_column):
+    """datetime64[s] times and float64 values of fixed width data rows."""
+    if len(rows) == 0:
+        return np.zeros(0, dtype='M8[s]'), np.zeros(0, dtype=np.float64)
+
+    width, fields, literals = style_layout(style)
+
+    if rows.itemsize <= value_column:
+        raise ValueError("Log line too short")
+
+    chars = rows.view(np.uint8).reshape(len(rows), rows.itemsize)
+
+    for column, literal in literals:
+        bad = np.flatnonzero(chars[:, column] != literal)
+        if len(bad):
+            raise ValueError("Bad log line: " + rows[bad[0]].decode('ascii', 'replace'))
+
+    digits = chars[:, :width].astype(np.int64) - ord("0")
+
+    # privzete vrednosti kot pri strptime
+    number = {"Y": 1900, "m": 1, "d": 1, "H": 0, "M": 0, "S": 0}
+    for field, column in fields.items():
+        part = digits[:, column:column + LOG_FIELD_WIDTH[field]]
+
+        if np.any((part < 0) | (part > 9)):
+            raise ValueError("Bad log time field: %" + field)
+
+        number[field] = part.dot(10 ** np.arange(LOG_FIELD_WIDTH[field] - 1, -1, -1))
+
+    if np.any((number["m"] < 1) | (number["m"] > 12)) or np.any((number["d"] < 1) | (number["d"] > 31)):
+        raise ValueError("Bad log date")
+
+    times = (np.asarray(number["Y"] - 1970).astype('M8[Y]').astype('M8[M]') + np.asarray(number["m"] - 1).astype('m8[M]'))
+    times = times.astype('M8[D]') + np.asarray(number["d"] - 1).astype('m8[D]')
+    seconds = number["H"] * 3600 + number["M"] * 60 + number["S"]
+    times = times.astype('M8[s]') + np.asarray(seconds).astype('m8[s]')
+
+    values = np.ascontiguousarray(chars[:, value_column:]).view('S' + str(rows.itemsize - value_column)).ravel()
+
+    return np.broadcast_to(times, (len(rows),)).copy(), values.astype(np.float64)
+
+
+def header_meta(header, meta=None):
+    meta = {"title": "", "x": "", "y": ""} if meta is None else meta
+
+    # velja prva glava v datoteki
+    for read_line in reversed(header):
+        if read_line[0:9] == "#TITLE = ":
+            meta["title"] = read_line[9:].strip()
+
+        elif read_line[0:5] == "#X = ":
+            meta["x"] = read_line[5:].strip()
+
+        elif read_line[0:5] == "#Y = ":
+            meta["y"] = read_line[5:].strip()
+
+    return meta
+
+
+class LogReadCancelled(Exception):
+    pass
+
+
+class GrowableArray:
+    """Preallocated array that doubles its capacity when full."""
+
+    def __init__(self, dtype, capacity=4096):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, values):
+        end = self.size + len(values)
+        dtype = np.promote_types(self.data.dtype, values.dtype)
+
+        if end > len(self.data) or dtype != self.data.dtype:
+            capacity = max(len(self.data), 1)
+            while capacity < end:
+                capacity *= 2
+
+            data = np.empty(capacity, dtype=dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+        self.data[self.size:end] = values
+        self.size = end
+
+    def view(self):
+        return self.data[:self.size]
+
+    def array(self):
+        # odrezemo neporabljeno rezervo, brez kopije
+        self.data.resize(self.size, refcheck=False)
+        return self.data
+
+
+def iter_log_lines(location, chunk_size=LOG_CHUNK_SIZE, start=0, partial=True, end=None):
+    """Yields (lines, position, size) of at most chunk_size bytes of whole lines.
+
+    Reading starts at byte offset start and stops at end.  A last line
+    without a newline is only yielded when partial is set, since it may
+    still be being written.
+    """
+    size = os.path.getsize(location) if end is None else end
+    rest = b""
+
+    with open(location, 'rb') as log:
+        log.seek(start)
+
+        while True:
+            chunk = log.read(min(chunk_size, size - log.tell()))
+
+            if not chunk:
+                break
+
+            chunk = rest + chunk
+            end = chunk.rfind(b"\n") + 1
+            rest = chunk[end:]
+
+            yield chunk[:end].splitlines(), log.tell() - len(rest), size
+
+    if rest and partial:
+        yield rest.splitlines(), size, size
+
+
+def iter_text_log(location, chunk_size=LOG_CHUNK_SIZE, start=0, layout=None, partial=True):
+    """Yields (metadata, layout, times, values, position, size) chunk by chunk."""
+    meta = header_meta([])
+
+    for lines, position, size in iter_log_lines(location, chunk_size, start, partial):
+        rows, header = split_log_lines(lines)
+
+        if layout is None: # glava je pred prvo vrstico s podatki
+            meta = header_meta(header, meta)
+
+        if len(rows) == 0:
+            yield meta, layout, np.zeros(0, dtype='M8[s]'), np.zeros(0, dtype=np.float64), position, size
+            continue
+
+        if layout is None:
+            layout = detect_layout(rows[:LOG_STYLE_SAMPLE].tolist())
+
+        times, values = parse_log_rows(rows, *layout)
+
+        yield meta, layout, times, values, position, size
+
+
+def parse_text_log(location, progress=None, chunk_size=LOG_CHUNK_SIZE, start=0, layout=None, partial=True):
+    """(metadata, layout, times, values, end offset) of the log from byte offset start.
+
+    The file is parsed chunk by chunk, so besides the result only one chunk
+    is held in memory.  progress(position, size) returning False cancels.
+    """
+    meta = header_meta([])
+    times = GrowableArray('M8[s]')
+    values = GrowableArray(np.float64)
+    position = start
+
+    for meta, layout, chunk_times, chunk_values, position, size in iter_text_log(location, chunk_size, start, layout, partial):
+        times.extend(chunk_times)
+        values.extend(chunk_values)
+
+        if progress is not None and not progress(position, size):
+            raise LogReadCancelled(location)
+
+    return meta, layout, times.array(), narrow_values(values.array()), position
+
+
+def read_text_log(location, progress=None, chunk_size=LOG_CHUNK_SIZE):
+    """(metadata, datetime64[s] times, values) of a text log."""
+    meta, layout, times, values, position = parse_text_log(location, progress, chunk_size)
+
+    return meta, times, values
+
+
+def narrow_values(values):
+    """values in the narrowest dtype that holds them exactly."""
+    if len(values) == 0:
+        return values
+
+    if np.all(values % 1 == 0):
+        low, high = values.min(), values.max()
+
+        for dtype in (np.int8, np.int16, np.int32, np.int64):
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                return values.astype(dtype)
+
+    single = values.astype(np.float32)
+    if np.array_equal(single, values):
+        return single
+
+    return values
+
+
+def times_datenum(times):
+    # datetime64 -> matplotlib datum, brez pretvorbe vsake tocke posebej
+    return EPOCH_DATENUM + times.astype('M8[ns]').view(np.int64) / 86400e9
+
+
+def log_progress(parent, title):
+    """Progress callback for read_text_log backed by a QProgressDialog."""
+    dialog = QProgressDialog(title, "Cancel", 0, 1000, parent)
+    dialog.setWindowModality(Qt.WindowModal)
+    dialog.setMinimumDuration(500)
+
+    def progress(position, size):
+        if position >= size:
+            dialog.close()
+            return True
+
+        dialog.setValue(int(1000 * position / size))
+        QApplication.processEvents()
+
+        return not dialog.wasCanceled()
+
+    return progress
+
+'''
+----------   Level of detail   ----------
+'''
+
+LOD_FACTOR = 4 # st. vzorcev na bin naslednjega nivoja
+LOG_FOLLOW_INTERVAL = 1 # s, privzeti interval preverjanja pri sledenju logu
+
+
+class LodPyramid(object):
+    """Min/max pyramid of a sorted time series.
+
+    Level k holds the min and max of every LOD_FACTOR ** k samples, so a
+    view can be drawn with about two points per pixel from the level whose
+    bins are just small enough.
+    """
+
+    def __init__(self, times, values):
+        self.levels = [] # (bin, mins, maxs)
+        self.update(times, values, 0)
+
+    def update(self, times, values, start):
+        """Rebuilds only the bins from sample start on, after appending."""
+        self.times = times
+        self.values = values
+
+        levels = []
+        mins = maxs = values
+        step = 1
+
+        while len(mins) > 1:
+            step *= LOD_FACTOR
+            first = start // step if len(levels) < len(self.levels) else 0
+            begin = first * LOD_FACTOR
+
+            starts = np.arange(0, len(mins) - begin, LOD_FACTOR)
+            tail_mins = np.minimum.reduceat(mins[begin:], starts)
+            tail_maxs = np.maximum.reduceat(maxs[begin:], starts)
+
+            if first:
+                old_step, old_mins, old_maxs = self.levels[len(levels)]
+                tail_mins = np.concatenate((old_mins[:first], tail_mins))
+                tail_maxs = np.concatenate((old_maxs[:first], tail_maxs))
+
+            mins, maxs = tail_mins, tail_maxs
+            levels.append((step, mins, maxs))
+
+        self.levels = levels
+
+    @staticmethod
+    def is_sorted(times):
+        return len(times) < 2 or not np.any(times[1:] < times[:-1])
+
+    def window(self, start, end, pixels):
+        """(times, values) for [start, end) with at most ~2 * pixels points."""
+        i0 = max(np.searchsorted(self.times, start, 'left') - 1, 0)
+        i1 = min(np.searchsorted(self.times, end, 'right') + 1, len(self.times))
+
+        if i1 - i0 <= 2 * pixels:
+            return self.times[i0:i1], self.values[i0:i1]
+
+        for step, mins, maxs in self.levels:
+            if (i1 - i0) // step <= pixels:
+                break
+
+        j0 = i0 // step
+        j1 = -(-i1 // step)
+
+        # vsak bin narisemo kot navpicno crto min -> max
+        times = np.repeat(self.times[j0 * step:j1 * step:step], 2)
+        values = np.empty(2 * (j1 - j0), dtype=mins.dtype)
+        values[0::2] = mins[j0:j1]
+        values[1::2] = maxs[j0:j1]
+
+        return times, values
+
+
+def datenum_times(datenum, dtype):
+    # matplotlib datum -> datetime64 (obratno od times_datenum)
+    return np.int64((datenum - EPOCH_DATENUM) * 86400e9).astype('M8[ns]').astype(dtype)
+
+'''
+----------   Log cache   ----------
+'''
+
+LOG_CACHE_DIR = os.path.join(CONFIG_DIR, "log-cache")
+LOG_CACHE_BUDGET = 512 * 1024 * 1024 # bajtov
+LOG_CACHE_CHECK = 4096 # zadnji bajti razclenjenega dela za preverjanje dodajanja
+
+
+class LogCache(object):
+    """Parsed text logs stored as .npy arrays, keyed by path, size and mtime.
+
+    Hits are memory-mapped.  A log that only grew is parsed from the cached
+    offset on, anything else is parsed again.  Entries are evicted least
+    recently used first when the cache exceeds its budget.
+    """
+
+    def __init__(self, directory=LOG_CACHE_DIR, budget=LOG_CACHE_BUDGET):
+        self.directory = directory
+        self.budget = budget
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def key(location):
+        return hashlib.sha1(os.path.abspath(location).encode('utf8')).hexdigest()
+
+    @staticmethod
+    def check(location, offset):
+        with open(location, 'rb') as log:
+            log.seek(max(offset - LOG_CACHE_CHECK, 0))
+            return hashlib.sha1(log.read(min(offset, LOG_CACHE_CHECK))).hexdigest()
+
+    def entry(self, key, location):
+        try:
+            with open(self.path(key + ".json"), 'r', encoding='utf8') as data:
+                entry = json.load(data)
+
+            if entry["path"] != os.path.abspath(location):
+                return None
+
+            times = np.load(self.path(entry["times"]), mmap_mode='r')
+            values = np.load(self.path(entry["values"]), mmap_mode='r')
+
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return entry, times, values
+
+    def load(self, location, progress=None):
+        """(metadata, times, values, layout, offset) of a text log."""
+        key = self.key(location)
+        stat = os.stat(location)
+        cached = self.entry(key, location)
+
+        if cached is not None:
+            entry, times, values = cached
+            layout = None if entry["layout"] is None else tuple(entry["layout"])
+
+            if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                self.touch(key)
+                return entry["meta"], times, values, layout, entry["offset"]
+
+            if stat.st_size > entry["size"] and self.check(location, entry["offset"]) == entry["check"]:
+                # datoteka je samo zrasla, razclenimo le nov del
+                meta, layout, new_times, new_values, offset = parse_text_log(location, progress, start=entry["offset"],
+                                                                             layout=layout, partial=False)
+                times = np.concatenate((times, new_times))
+                values = narrow_values(np.concatenate((values, new_values)))
+                self.store(key, location, entry["meta"], layout, times, values, offset)
+
+                return entry["meta"], times, values, layout, offset
+
+        meta, layout, times, values, offset = parse_text_log(location, progress, partial=False)
+        self.store(key, location, meta, layout, times, values, offset)
+
+        return meta, times, values, layout, offset
+
+    def store(self, key, location, meta, layout, times, values, offset):
+        stat = os.stat(location)
+        entry = {"path": os.path.abspath(location), "size": stat.st_size, "mtime": stat.st_mtime,
+                 "offset": offset, "check": self.check(location, offset), "meta": meta, "layout": layout,
+                 "count": len(times)}
+
+        # nova imena datotek, ker so stare lahko se odprte (memmap)
+        entry["times"] = key + "-" + str(len(times)) + ".t.npy"
+        entry["values"] = key + "-" + str(len(times)) + ".v.npy"
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            np.save(self.path(entry["times"]), times)
+            np.save(self.path(entry["values"]), values)
+
+            with open(self.path(key + ".json.tmp"), 'w', encoding='utf8') as data:
+                json.dump(entry, data)
+
+            os.replace(self.path(key + ".json.tmp"), self.path(key + ".json"))
+
+        except OSError:
+            return
+
+        self.evict(key, keep=(entry["times"], entry["values"]))
+
+    def touch(self, key):
+        try:
+            os.utime(self.path(key + ".json"))
+
+        except OSError:
+            pass
+
+    def evict(self, current, keep=()):
+        try:
+            names = os.listdir(self.directory)
+
+        except OSError:
+            return
+
+        entries = {}
+        total = 0
+
+        for name in names:
+            try:
+                stat = os.stat(self.path(name))
+
+            except OSError:
+                continue
+
+            key = name.split(".")[0].split("-")[0]
+            used, size = entries.get(key, (0, 0))
+
+            if name.endswith(".json"):
+                used = stat.st_mtime
+
+            # stare razlicice trenutnega vnosa
+            elif key == current and name not in keep:
+                self.remove(name)
+                continue
+
+            entries[key] = (used, size + stat.st_size)
+            total += stat.st_size
+
+        for used, key in sorted([(used, key) for key, (used, size) in entries.items()]):
+            if total <= self.budget:
+                break
+
+            if key != current:
+                for name in names:
+                    if name.startswith(key):
+                        self.remove(name)
+
+                total -= entries[key][1]
+
+    def remove(self, name):
+        try:
+            os.remove(self.path(name))
+
+        except OSError:
+            pass # na Windows je lahko se odprta
+
+
+log_cache = LogCache()
+
+'''
+----------   Log index   ----------
+'''
+
+LOG_INDEX_MAGIC = b'POSIDX\x00\x01'
+LOG_INDEX_DTYPE = np.dtype([('t', '<i8'), ('o', '<i8')]) # cas [s], odmik vrstice v datoteki
+LOG_INDEX_STEP = 256 * 1024 # bajtov med tockami indeksa
+LOG_INDEX_PEEK = 4096 # bajtov, ki jih preberemo za eno tocko
+
+
+class LogIndex(object):
+    """Sidecar <log>.idx mapping time checkpoints to byte offsets of a text log.
+
+    A checkpoint is the first data line at or after every LOG_INDEX_STEP
+    bytes, so only those few lines are parsed to build it.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.path = location + ".idx"
+        self.size = 0
+        self.check = None
+        self.layout = None
+        self.last = None
+        self.points = np.zeros(0, dtype=LOG_INDEX_DTYPE)
+
+    @classmethod
+    def open(cls, location):
+        """Index of the log, read from its sidecar and updated, or built."""
+        index = cls(location)
+        size = os.path.getsize(location)
+
+        if not index.read():
+            index.build(0)
+
+        elif size < index.size or LogCache.check(location, index.size) != index.check:
+            index.points = index.points[:0]
+            index.build(0)
+
+        elif size > index.size:
+            # log je zrasel, dodamo tocke od zadnje naprej
+            start = int(index.points['o'][-1]) + LOG_INDEX_STEP if len(index.points) else 0
+            index.build(start)
+
+        return index
+
+    def read(self):
+        try:
+            with open(self.path, 'rb') as data:
+                if data.read(len(LOG_INDEX_MAGIC)) != LOG_INDEX_MAGIC:
+                    return False
+
+                length, = struct.unpack('<I', data.read(4))
+                meta = json.loads(data.read(length).decode('utf8'))
+                self.points = np.frombuffer(data.read(), dtype=LOG_INDEX_DTYPE).copy()
+
+        except (OSError, ValueError, struct.error):
+            return False
+
+        self.size = meta["size"]
+        self.check = meta["check"]
+        self.layout = None if meta["layout"] is None else tuple(meta["layout"])
+        self.last = meta["last"]
+
+        return True
+
+    def write(self):
+        meta = json.dumps({"size": self.size, "check": self.check, "layout": self.layout, "last": self.last})
+        meta = meta.encode('utf8')
+
+        try:
+            with open(self.path + ".tmp", 'wb') as data:
+                data.write(LOG_INDEX_MAGIC + struct.pack('<I', len(meta)) + meta)
+                data.write(self.points.tobytes())
+
+            os.replace(self.path + ".tmp", self.path)
+
+        except OSError:
+            pass # imenik loga ni zapisljiv, indeks ostane samo v pomnilniku
+
+    def first_line(self, log, offset):
+        """(line, offset) of the first data line starting at or after offset."""
+        log.seek(offset)
+        data = log.read(LOG_INDEX_PEEK)
+
+        if offset > 0:
+            # preskocimo konec vrstice, v katero smo skocili
+            log.seek(offset - 1)
+            if log.read(1) != b"\n":
+                skip = data.find(b"\n") + 1
+                if skip == 0:
+                    return None, None
+                offset += skip
+                data = data[skip:]
+
+        for line in data.split(b"\n")[:-1]:
+            if line.strip() and line[:1] != b"#":
+                return line.rstrip(b"\r"), offset
+
+            offset += len(line) + 1
+
+        return None, None
+
+    def build(self, start):
+        size = os.path.getsize(self.location)
+        lines = []
+        offsets = []
+
+        with open(self.location, 'rb') as log:
+            for offset in range(start, size, LOG_INDEX_STEP):
+                line, line_offset = self.first_line(log, offset)
+
+                if line is not None and (not offsets or line_offset > offsets[-1]):
+                    lines.append(line)
+                    offsets.append(line_offset)
+
+            # cas zadnje cele vrstice
+            log.seek(max(size - LOG_INDEX_PEEK, 0))
+            tail = [line.rstrip(b"\r") for line in log.read().split(b"\n")[1:-1]]
+            tail = [line for line in tail if line.strip() and line[:1] != b"#"]
+
+        if lines and self.layout is None:
+            self.layout = detect_layout(lines)
+
+        if lines:
+            times, values = parse_log_rows(np.array(lines, dtype=bytes), *self.layout)
+            points = np.empty(len(lines), dtype=LOG_INDEX_DTYPE)
+            points['t'] = times.astype(np.int64)
+            points['o'] = offsets
+
+            # tocke, ki jih ze imamo, se ne ponovijo
+            keep = self.points['o'] < offsets[0]
+            self.points = np.concatenate((self.points[keep], points))
+
+        if tail and self.layout is not None:
+            self.last = int(parse_log_rows(np.array(tail[-1:], dtype=bytes), *self.layout)[0].astype(np.int64)[0])
+
+        self.size = size
+        self.check = LogCache.check(self.location, size)
+        self.write()
+
+    def sorted(self):
+        return LodPyramid.is_sorted(self.points['t'])
+
+    def span(self, t0, t1):
+        """Byte range [start, end) that holds every line with t0 <= time < t1."""
+        times = self.points['t']
+        i0 = np.searchsorted(times, t0, 'left') - 1
+        i1 = np.searchsorted(times, t1, 'left')
+
+        start = int(self.points['o'][i0]) if i0 >= 0 else 0
+        end = int(self.points['o'][i1]) if i1 < len(times) else self.size
+
+        return start, end
+
+
+def read_log_meta(location):
+    if is_binary_log(location):
+        return open_binary_log(location)[0]
+
+    with open(location, 'rb') as log:
+        lines = log.read(LOG_INDEX_PEEK).split(b"\n")
+
+    return header_meta([line.decode('utf8', 'replace') for line in lines if line[:1] == b"#"])
+
+
+def log_time_span(location):
+    """(first, last) datetime64[s] of a log, without loading it."""
+    if is_binary_log(location):
+        times = open_binary_log(location)[1]['t'].view('M8[ns]')
+
+        if len(times) == 0:
+            return None, None
+
+        return times[0].astype('M8[s]'), times[-1].astype('M8[s]')
+
+    index = LogIndex.open(location)
+
+    if len(index.points) == 0:
+        return None, None
+
+    return index.points['t'][0].astype('M8[s]'), np.datetime64(index.last, 's')
+
+
+def load_log_range(location, t0, t1):
+    """(times, values) of the log samples with t0 <= time < t1.
+
+    t0 and t1 are anything np.datetime64 accepts, in the log's local time.
+    Text logs only parse the bytes between the enclosing index checkpoints;
+    binary logs are searched in their memmap.
+    """
+    if is_binary_log(location):
+        meta, records = open_binary_log(location)
+        times = records['t'].view('M8[ns]')
+        i0, i1 = np.searchsorted(times, [np.datetime64(t0, 'ns'), np.datetime64(t1, 'ns')])
+
+        return times[i0:i1], records['v'][i0:i1]
+
+    t0 = np.datetime64(t0, 's')
+    t1 = np.datetime64(t1, 's')
+    index = LogIndex.open(location)
+
+    if index.layout is None:
+        return np.zeros(0, dtype='M8[s]'), np.zeros(0, dtype=np.float64)
+
+    if index.sorted():
+        start, end = index.span(t0.astype(np.int64), t1.astype(np.int64))
+    else:
+        start, end = 0, index.size
+
+    times = GrowableArray('M8[s]')
+    values = GrowableArray(np.float64)
+
+    # zadnja vrstica brez "\n" se morda se pise
+    for lines, position, size in iter_log_lines(location, start=start, end=end, partial=False):
+        rows, header = split_log_lines(lines)
+        chunk_times, chunk_values = parse_log_rows(rows, *index.layout)
 
-        self.kill_thread = 0
+        inside = (chunk_times >= t0) & (chunk_times < t1)
+        times.extend(chunk_times[inside])
+        values.extend(chunk_values[inside])
 
-    def closeEvent(self, event):
-        self.kill_thread = 1
+    return times.array(), narrow_values(values.array())
 
-    def run(self):
-        while True:
-            if self.kill_thread == 0:
-                s = self.ser.read(0)
-                line = self.ser.readline()
+'''
+----------   Log writer   ----------
+'''
 
-                #line = line.decode("utf-8")
+LOG_QUEUE_SIZE = 1000 # paketov vzorcev
+LOG_FLUSH_INTERVAL = 1.0 # [s]
 
-                if line in (b'\x00\x00\x00\x00\x00\x00\x000\x00\n', b'0\x00\n'):
-                    self.debug_thread.emit("0")
+FSYNC_NEVER = "never"
+FSYNC_FLUSH = "flush" # fsync ob vsakem flush
+FSYNC_CLOSE = "close"
 
-                elif line == b'1\x00\n':
-                    self.debug_thread.emit("1")
+LOG_SEPARATOR_LINE = "#------------------------------------------------------------------"
 
-                elif len(line) >= 10:
-                    line = line.strip()
-                    line = line.decode("utf-8")
 
-                    k = 1
-                    message = []
-                    for i in range(0, len(line)):
-                        if line[i] != '\x00':
-                            message.append(line[i])
-                            k += 1
+def format_stamps(stamps, style):
+    """strftime for a batch of epoch stamps; each second is formatted once."""
+    seconds = np.floor(stamps).astype(np.int64)
+    unique, inverse = np.unique(seconds, return_inverse=True)
+    texts = np.array([dt.fromtimestamp(second).strftime(style) for second in unique], dtype=object)
 
-                    e = ""
-                    for i in range(0, len(message)):
-                        e += str(message[i])
+    return texts[inverse.ravel()]
 
-                    f = e.strip()
 
-                    self.debug_thread.emit(f)
+class LogWriter(QThread):
+    """Writes a live log from a bounded queue on its own thread.
 
-                #elif len(line) > 10:
-                 #   line = line.strip()
-                  #  #line = line.decode("utf-8")
+    The file is opened by the constructor, so a bad path raises OSError in
+    the caller; later write errors stop the thread and are sent as failed.
+    """
+    failed = pyqtSignal(str)
 
-                   # line = str(line)
-                    #self.debug_thread.emit(line)
+    def __init__(self, location, style, separator, flush_interval=LOG_FLUSH_INTERVAL, fsync=FSYNC_CLOSE,
+                 maxsize=LOG_QUEUE_SIZE):
+        super(LogWriter, self).__init__()
 
-                else:
-                    pass
+        self.location = location
+        self.style = style
+        self.separator = separator
+        self.flush_interval = flush_interval
+        self.fsync = fsync
 
-                time.sleep(0.4)
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0 # zavrzeni vzorci (polna vrsta)
+        self.written = 0
+        self.lag = 0.0 # starost zadnjega zapisanega vzorca [s]
+        self.closing = False
 
-            elif self.kill_thread == 1:
-                self.ser.close()
-                time.sleep(0.4)
-                self.terminate()
+        self.log = open(self.location, 'ab')
+        self.has_header = self.log.tell() > 0
 
-'''
-----------   Calibrate Sensor   ----------
-'''
+    def write_header(self, title, x_label, y_label):
+        try:
+            self.queue.put_nowait(("header", (title, x_label, y_label)))
 
+        except queue.Full:
+            pass # pisanje zaostaja, vzorci se ze zavrzejo
 
-class CalibrateSensor(QWidget):
-    def __init__(self):
-        super(CalibrateSensor, self).__init__()
+    def put(self, values, stamps):
+        if not self.isRunning():
+            self.dropped += len(values) # nit se je ustavila zaradi napake
+            return
 
-        self.port = " "
-        self.serial_selected = 0
+        try:
+            self.queue.put_nowait(("data", (values, stamps)))
 
-        self.setWindowTitle('Sensor calibration')
-        self.resize(350, 80)
-        self.move(100, 200)
+        except queue.Full:
+            self.dropped += len(values)
 
-        self.progressbar = QProgressBar()
-        self.progressbar.reset()  # resets the progress bar
-        self.progressbar.setAlignment(Qt.AlignCenter)  # centers the text
-        self.progressbar.setFormat('%p%')
-        self.progressbar.valueChanged.connect(self.progress_changed)
+    def close(self):
+        """Write what is queued and close the file; never blocks on a full queue."""
+        self.closing = True
 
-        self.btn_close = QPushButton('Close')
-        self.btn_close.clicked.connect(self.close)
+        try:
+            self.queue.put_nowait(None)
 
-        self.comboBox = QComboBox()
-        self.comboBox.addItem(" ")
+        except queue.Full:
+            pass # run se ustavi, ko izprazni vrsto
 
-        available_ports = [port[0] for port in list_ports.comports()]
+        if self.isRunning():
+            self.wait()
 
-        for i in range(0, len(available_ports)):
-            self.comboBox.addItem(available_ports[i])
+        elif not self.log.closed:
+            self.log.close() # nit se ni zagnala
 
-        self.comboBox.activated[str].connect(self.serial_port_select)
+    def depth(self):
+        return self.queue.qsize()
 
-        # timer
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.progress_simulation)
+    def header_text(self, title, x_label, y_label):
+        lines = ["#TITLE = " + title, "#X = " + x_label]
 
-        self.palette = QPalette(self.palette())
+        if y_label is not None:
+            lines.append("#Y = " + y_label)
 
-        # vertical layout
-        hbox = QHBoxLayout()
-        hbox.addWidget(self.comboBox)
-        hbox.addSpacing(110)
-        hbox.addWidget(self.btn_close)
-        hbox.addSpacing(5)
+        lines.append(LOG_SEPARATOR_LINE)
 
-        vbox = QVBoxLayout()
-        vbox.addWidget(self.progressbar)
-        vbox.addStretch(1)
-        vbox.addLayout(hbox)
-        self.setLayout(vbox)
+        return "\n".join(lines) + "\n"
 
-        self.show()
+    def data_text(self, values, stamps):
+        times = format_stamps(stamps, self.style)
 
-    def serial_port_select(self, port):
-        self.port = port
+        return "".join([time_text + self.separator + str(value) + "\n" for time_text, value in zip(times, values.tolist())])
 
-        if self.port != " ":
-            self.serial_selected = 1
-            self.ser = serial.Serial(
-                port=self.port,
-                baudrate=9600,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=0)
+    def header_bytes(self, title, x_label, y_label):
+        if self.style != BINARY_LOG:
+            return self.header_text(title, x_label, y_label).encode('utf8')
 
-            self.calibrate_sensor()
-        else:
-            self.serial_selected = 0
+        if not self.has_header: # binarni log ima glavo samo na zacetku
+            self.has_header = True
+            return binlog_header(title, x_label, "" if y_label is None else y_label)
 
-    def closeEvent(self, event):
-        if self.serial_selected == 1:
-            self.ser.close()
+        return b''
 
-    def calibrate_sensor(self):
-        self.ser.write(b'CALIBRATE1')
+    def data_bytes(self, values, stamps):
+        if self.style != BINARY_LOG:
+            return self.data_text(values, stamps).encode('utf8')
 
-        time.sleep(0.1)
+        return binlog_records(local_ns(stamps), values).tobytes()
 
-        s = self.ser.read(0)
-        line = self.ser.readline()  # read a '\n' terminated line
+    def flush(self, log):
+        log.flush()
 
-        if line == b'Izvaja se ADC kalibracijski proces senzorja!\r\n':
+        if self.fsync == FSYNC_FLUSH:
+            os.fsync(log.fileno())
 
-            self.complite = 0
-            self.start()
+    def run(self):
+        try:
+            self.write_log(self.log)
 
-        elif line != b'Izvaja se ADC kalibracijski proces senzorja!\r\n':
-            self.fail()
+        except (OSError, ValueError) as error:
+            self.failed.emit(str(error))
 
-        self.setPalette(self.palette)
+        finally:
+            try:
+                self.log.close()
 
-    def progress_simulation(self):
-        self.value = self.progressbar.value()  # gets the current value of the progress bar
-        self.progressbar.setValue(self.value + 1)  # adds 1 to the current value
+            except OSError:
+                pass
 
-    def fail(self):
-        self.var_fail = 1
-        self.timer.start(8)  # interval of 200 milliseconds
-        self.palette.setColor(QPalette.Highlight, QColor(Qt.red))
+    def write_log(self, log):
+        last_flush = time.monotonic()
+        running = True
 
-    def start(self):
-        self.var_fail = 0
-        self.timer.start(75)  # interval of 200 milliseconds
-        self.palette.setColor(QPalette.Highlight, QColor(Qt.blue))
+        while running:
+            try:
+                items = [self.queue.get(timeout=self.flush_interval)]
 
-    def progress_changed(self, value):
-        if self.var_fail == 0:
-            s = self.ser.read(0)  # read up to three bytes (timeout)
-            line = self.ser.readline()  # read a '\n' terminated line
+            except queue.Empty:
+                items = []
 
-            if line == b'Kalibracijski proces uspesno zakljucen\r\n':
-                self.palette.setColor(QPalette.Highlight, QColor(Qt.green))
-                self.setPalette(self.palette)
+            # everything already queued goes out in the same block
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
 
-                self.timer.stop()
-                self.timer.start(1)
+                except queue.Empty:
+                    break
 
-                self.complite = 1
+            block = []
+            newest = None
 
-            if self.complite == 0 and value == 98:
-                self.palette.setColor(QPalette.Highlight, QColor(Qt.red))
-                self.setPalette(self.palette)
+            for item in items:
+                if item is None:
+                    running = False
 
-                self.progressbar.setFormat('Calibration Failed')
-                self.timer.stop()
-                self.timer.start(1)
+                elif item[0] == "header":
+                    block.append(self.header_bytes(*item[1]))
 
-            if value == 99 and self.complite == 1:
-                self.progressbar.setFormat('Calibration Complete')
-                self.timer.stop()
-                self.timer.start(1)
+                else:
+                    values, stamps = item[1]
+                    block.append(self.data_bytes(values, stamps))
+                    self.written += len(values)
+                    newest = stamps[-1]
 
-        elif self.var_fail == 1:
-            if value == 99:
-                self.progressbar.setFormat('Calibration Failed')
-                self.timer.stop()
-                self.timer.start(1)
+            if block:
+                log.write(b"".join(block))
 
+            if newest is not None:
+                self.lag = time.time() - newest
 
-        if value == 100:
-                self.timer.stop
-                time.sleep(3)
-                self.close()
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.flush(log)
+                last_flush = time.monotonic()
+
+            if self.closing and self.queue.empty():
+                running = False
+
+        self.flush(log)
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(log.fileno())
 
 '''
 ----------   SelectGraph   ----------
@@ -940,7 +4516,7 @@ class MplDrawGraph(QWidget):
         self.pause = 0  # je bila tipka Pause pritisnjena
         self.button_log = 0  # je bila tipka Ok (log file) pritisnjena
         self.draw_data = 0 # izris grafa je izbran
-        self.log_data = 0 # log data je izbran
+        self.log_writer = None # log data je izbran
         self.lenght = 10 # amplituda
         self.stoped = 1 #vse je izklopljeno
         self.step_mode_enable = 0 #step nacin
@@ -954,14 +4530,27 @@ class MplDrawGraph(QWidget):
 
         self.draw_graph(self)
 
+        self.scheduler = RenderScheduler(self.render_frame, LIVE_FPS, self)
+        self.scheduler.stats_changed.connect(self.render_stats)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll)
+
     def closeEvent(self, event):
+        unwatch_ports(self.fill_ports)
+        self.scheduler.stop()
+
         if self.port != " ":
-            if draw == 1:
-                self.drawthread.terminate()
-                #os.system("chmod 444 " + self.log_name) #read only log file
+            self.selector = 0
+            #os.system("chmod 444 " + self.log_name) #read only log file
+
+            self.poll_timer.stop()
+            data_bus.unsubscribe(self.samples)
+            self.port = " "
 
         if self.button_log == 1:
-            self.log_data.close()
+            self.button_log = 0
+            self.log_writer.close()
 
     def draw_graph(self, MplDrawGraph):
         MplDrawGraph.setObjectName("MplDrawGraph")
@@ -994,12 +4583,8 @@ class MplDrawGraph(QWidget):
         self.combo = QComboBox(self.verticalLayoutWidget)
         self.combo.setFrame(True)
         self.combo.setObjectName("comboBox")
-        self.combo.addItem(" ")
-
-        available_ports = [port[0] for port in list_ports.comports()]
-
-        for i in range(0, len(available_ports)):
-            self.combo.addItem(available_ports[i])
+        fill_port_combo(self.combo)
+        port_registry.ports_changed.connect(self.fill_ports)
 
         self.verticalLayout.addWidget(self.combo)
 
@@ -1063,6 +4648,10 @@ class MplDrawGraph(QWidget):
         self.steplineEdit.setObjectName("step_value")
         self.verticalLayout.addWidget(self.steplineEdit)
 
+        self.fps_label = QLabel()
+        self.fps_label.setText("")
+        self.verticalLayout.addWidget(self.fps_label)
+
         spacerItem2 = QSpacerItem(20, 15, QSizePolicy.Minimum, QSizePolicy.Fixed)
         self.verticalLayout.addItem(spacerItem2)
 
@@ -1117,12 +4706,8 @@ class MplDrawGraph(QWidget):
         self.comboBox_2 = QComboBox(self.groupBox)
         self.comboBox_2.setGeometry(QRect(5, 20, 220, 20))
         self.comboBox_2.setObjectName("comboBox_2")
-        self.comboBox_2.addItem("%Y-%d-%m %H:%M:%S , data")
-        self.comboBox_2.addItem("%H:%M:%S , data")
-        self.comboBox_2.addItem("%d-%m %H:%M:%S , data")
-        self.comboBox_2.addItem("%d-%m-%H:%M:%S,data")
-        self.comboBox_2.addItem("%H:%M:%S,data")
-        self.comboBox_2.addItem("%H%M%S,data")
+        for label, style, separator in LOG_STYLES:
+            self.comboBox_2.addItem(label)
 
         self.lineEdit = QLineEdit(self.groupBox)
         self.lineEdit.setGeometry(QRect(5, 50, 151, 20))
@@ -1135,11 +4720,15 @@ class MplDrawGraph(QWidget):
         self.pushButton_2.setGeometry(QRect(160, 50, 31, 20))
         self.pushButton_2.setText("Ok")
 
+        self.log_label = QLabel(self.groupBox)
+        self.log_label.setGeometry(QRect(5, 73, 220, 20))
+        self.log_label.setText("")
+
         self.retranslateUi(MplDrawGraph)
         QMetaObject.connectSlotsByName(MplDrawGraph)
 
     def retranslateUi(self, MplDrawGraph):
-        self.combo.activated[str].connect(self.port_select) # izberi port
+        self.combo.activated[int].connect(lambda index: self.port_select(combo_port(self.combo, index))) # izberi port
 
         self.pushButton.clicked.connect(self.button_adc) # tipka Draw ADC
         self.pushButton_3.clicked.connect(self.button_val) # tipka Draw value
@@ -1163,9 +4752,55 @@ class MplDrawGraph(QWidget):
 
         self.lineEdit.textChanged.connect(self.log_name_selected) # spremeni log file name
 
+    def fill_ports(self):
+        fill_port_combo(self.combo)
+
     def port_select(self, port):
+        if self.port != " ":
+            if self.selector == 1 or self.selector == 2:
+                self.draw_selector("button_stop")
+
+            self.poll_timer.stop()
+            data_bus.unsubscribe(self.samples)
+
         self.port = port
 
+        if port != " ":
+            try:
+                # the subscription keeps the port reader alive while the port is selected
+                self.samples = data_bus.subscribe(port, "samples")
+                forget_device_state(port) # izbira izhoda poslje ADC_MODE_1
+
+            except serial.SerialException as error:
+                port_error(self, error)
+                self.combo.setCurrentIndex(0)
+                self.port = " "
+                return
+
+            self.poll_timer.start(int(DRAW_MAX_LATENCY * 1000))
+
+    def poll(self):
+        for values, stamps in self.samples.get_all():
+            if self.selector == 1 or self.selector == 2:
+                self.change_value(values, stamps)
+
+        if self.samples.error is not None:
+            error = self.samples.error
+
+            self.selector = 0
+            self.port_select(" ")
+            self.combo.setCurrentIndex(0)
+
+            port_error(self, "Port disconnected: " + error)
+            return
+
+        if self.button_log == 1:
+            text = ("queue " + str(self.log_writer.depth()) + ", lag " + "%.2f" % self.log_writer.lag
+                    + " s, dropped " + str(self.log_writer.dropped))
+
+            if text != self.log_label.text():
+                self.log_label.setText(text)
+
     def button_adc(self):
         draw = 1
         self.stoped = 0
@@ -1183,13 +4818,9 @@ class MplDrawGraph(QWidget):
             # self.init_figure()
             if self.pause == 1:
                 self.pause = 0
-                if self.draw_data == 1 or self.log_data == 1:
-                    self.drawthread.start()
 
             elif self.pause == 0:
                 self.pause = 1
-                if self.draw_data == 1 or self.log_data == 1:
-                    self.drawthread.requestInterruption()
 
     def button_stop(self):
         self.stoped = 1
@@ -1204,7 +4835,11 @@ class MplDrawGraph(QWidget):
 
             self.draw_data = 0
 
-            plt.clf() # zapremo figure
+            self.scheduler.stop()
+            self.fps_label.clear()
+            self.renderer.close()
+            self.figure.clf() # zapremo figure
+            self.canvas.draw()
 
         else:
             self.horizontalSlider.setEnabled(True)
@@ -1242,226 +4877,185 @@ class MplDrawGraph(QWidget):
                 self.groupBox.setEnabled(True)
         else:
             self.button_log = 0
-            self.log_data.close()
+            self.log_writer.close()
+            self.log_label.clear()
 
     def button_start_log(self):
+        try:
+            self.log_writer = LogWriter(self.log_name, self.log_style, self.log_vejica)
+
+        except OSError as error:
+            QMessageBox.warning(self, "Log file", str(error), QMessageBox.Ok)
+            return
+
         self.groupBox.setEnabled(False)
         self.button_log = 1
         self.header_created = 0
 
-        self.log_data = open(self.log_name, 'a', encoding='utf8')
+        self.log_writer.failed.connect(self.log_failed)
+        self.log_writer.start()
 
-    def log_style_selected(self, style):
-        if style == "%Y-%d-%m %H:%M:%S , data":
-            self.log_style = "%Y-%d-%m %H:%M:%S"
-            self.log_vejica = " , "
+    def log_failed(self, message):
+        if self.button_log == 1:
+            self.button_log = 0
+            self.log_writer.close()
+            self.log_label.setText("log stopped")
 
-        elif style == "%H:%M:%S , data":
-            self.log_style = "%H:%M:%S"
-            self.log_vejica = " , "
+        QMessageBox.warning(self, "Log file", "Logging stopped: " + message, QMessageBox.Ok)
 
-        elif style == "%d-%m %H:%M:%S , data":
-            self.log_style = "%d-%m %H:%M:%S"
-            self.log_vejica = " , "
+    def log_style_selected(self, selected):
+        for label, style, separator in LOG_STYLES:
+            if label == selected:
+                self.log_style = style
+                self.log_vejica = separator
 
-        elif style == "%d-%m-%H:%M:%S,data":
-            self.log_style = "%d-%m %H:%M:%S"
-            self.log_vejica = ","
+        # binarni log dobi svojo koncnico
+        name, extension = os.path.splitext(self.log_name)
+        if self.log_style == BINARY_LOG and extension == ".txt":
+            self.log_name = name + ".bin"
 
-        elif style == "%H:%M:%S,data":
-            self.log_style = "H:%M:%S"
-            self.log_vejica = ","
+        elif self.log_style != BINARY_LOG and extension == ".bin":
+            self.log_name = name + ".txt"
+
+        self.lineEdit.setPlaceholderText(self.log_name)
 
-        elif style == "%H%M%S,data":
-            self.log_style = "%H%M%S"
-            self.log_vejica = ","
-                    
     def log_name_selected(self, name):
         self.log_name = name
 
     def draw_selector(self, button_id):
         if self.port != " ":
-            ser = serial.Serial(
-                port=self.port,
-                baudrate=9600,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=1)
-
-            if self.selector == 1 or self.selector == 2:
-                button_id = "button_stop"
-
-            if button_id == "button_adc":
-                self.selector = 1
-                ser.write(b'SW_VALUE_0')
-                s = ser.read(0)  # read up to three bytes (timeout)
-                line = ser.readline()  # read a '\n' terminated line
-
-                ser.write(b'SHOW_ADC_1')
-                s = ser.read(0)  # read up to ten bytes (timeout)
-                line1 = ser.readline()  # read a '\n' terminated line
+            try:
+                replies = data_bus.subscribe(self.port, "lines")
 
-                if line1 == b'Ispisuj ADC vrednosti!\r\n':
-                    s = ser.read(0)  # read up to ten bytes (timeout)
-                    line2 = ser.readline()  # read a '\n' terminated line
+            except serial.SerialException as error:
+                port_error(self, error)
+                return
 
-                    if line2 == b'Omogoci ADC pretvornik z uporabo ukaza: ADC_MODE_1.\r\n':
-                        ser.write(b'ADC_MODE_1')
-                        s = ser.read(0)  # read up to ten bytes (timeout)
-                        line3 = ser.readline()  # read a '\n' terminated line
+            try:
+                self.select_output(replies, button_id)
 
-                    self.pushButton.setStyleSheet("background-color: green")
-                    self.pushButton_3.setStyleSheet("background-color: white")
+            except serial.SerialException as error:
+                port_error(self, error) # port odklopljen med ukazi
 
-                    ser.close()
+            finally:
+                data_bus.unsubscribe(replies)
 
-                    self.drawthread = DrawThread(self.port)
-                    self.drawthread.draw_thread.connect(self.change_value)
-                    self.drawthread.setTerminationEnabled()
-                    self.drawthread.start()
-
-                else:
-                    ser.close()
-                    self.pushButton.setStyleSheet("background-color: red")
-                    self.pushButton_3.setStyleSheet("background-color: white")
-
-            elif button_id == "button_val":
-                self.selector = 2
-                ser.write(b'SHOW_ADC_0')
-                s = ser.read(0)  # read up to ten bytes (timeout)
-                line = ser.readline()  # read a '\n' terminated line
+        else:
+            pass
 
-                if line in (b'Ne ispisuj ADC vrednosti.\r\n', b'Ispisovanje ADC vrednosti je ze deaktivirano.\r\n'):
-                    ser.write(b'SW_VALUE_1')
-                    self.pushButton.setStyleSheet("background-color: white")
-                    self.pushButton_3.setStyleSheet("background-color: green")
+    def select_output(self, replies, button_id):
+        if self.selector == 1 or self.selector == 2:
+            button_id = "button_stop"
 
-                    ser.close()
+        if button_id == "button_adc":
+            self.selector = 1
+            line = data_bus.request(replies, b'SW_VALUE_0')  # read a '\n' terminated line
 
-                    self.drawthread = DrawThread(self.port)
-                    self.drawthread.draw_thread.connect(self.change_value)
-                    self.drawthread.setTerminationEnabled()
-                    self.drawthread.start()
+            line1 = data_bus.request(replies, b'SHOW_ADC_1')  # read a '\n' terminated line
 
-                else:
-                    self.pushButton.setStyleSheet("background-color: white")
-                    self.pushButton_3.setStyleSheet("background-color: red")
+            if line1 == b'Ispisuj ADC vrednosti!':
+                line2 = replies.reply()  # read a '\n' terminated line
 
-                    ser.close()
+                if line2 == b'Omogoci ADC pretvornik z uporabo ukaza: ADC_MODE_1.':
+                    line3 = data_bus.request(replies, b'ADC_MODE_1')  # read a '\n' terminated line
 
-            if button_id == "button_stop":
-                if self.selector == 1 or self.selector == 2:
-                    self.selector = 0
-                    ser.close()
+                self.pushButton.setStyleSheet("background-color: green")
+                self.pushButton_3.setStyleSheet("background-color: white")
 
-                    time.sleep(0.2)
+            else:
+                self.selector = 0
+                self.pushButton.setStyleSheet("background-color: red")
+                self.pushButton_3.setStyleSheet("background-color: white")
 
-                    self.drawthread.closeEvent(self.closeEvent)
+        elif button_id == "button_val":
+            self.selector = 2
+            line = data_bus.request(replies, b'SHOW_ADC_0')  # read a '\n' terminated line
 
-                    self.pushButton.setStyleSheet("background-color: white")
-                    self.pushButton_3.setStyleSheet("background-color: white")
+            if line in (b'Ne ispisuj ADC vrednosti.', b'Ispisovanje ADC vrednosti je ze deaktivirano.'):
+                data_bus.write(self.port, b'SW_VALUE_1')
+                self.pushButton.setStyleSheet("background-color: white")
+                self.pushButton_3.setStyleSheet("background-color: green")
 
-                    time.sleep(0.8)
+            else:
+                self.selector = 0
+                self.pushButton.setStyleSheet("background-color: white")
+                self.pushButton_3.setStyleSheet("background-color: red")
 
-                    ser = serial.Serial(
-                        port=self.port,
-                        baudrate=9600,
-                        parity=serial.PARITY_NONE,
-                        stopbits=serial.STOPBITS_ONE,
-                        bytesize=serial.EIGHTBITS,
-                        timeout=1)
+        if button_id == "button_stop":
+            if self.selector == 1 or self.selector == 2:
+                self.selector = 0
 
-                ser.write(b'SHOW_ADC_0')
-                s = ser.read(1)  # read up to ten bytes (timeout)
-                line = ser.readline()  # read a '\n' terminated line
+                self.pushButton.setStyleSheet("background-color: white")
+                self.pushButton_3.setStyleSheet("background-color: white")
 
-                ser.write(b'SW_VALUE_0')
-                s = ser.read(1)  # read up to ten bytes (timeout
+            line = data_bus.request(replies, b'SHOW_ADC_0', 0.2)  # read a '\n' terminated line
 
-                ser.close()
+            data_bus.write(self.port, b'SW_VALUE_0')
 
-        else:
-            pass
 
     def init_figure(self):
         if self.draw_data == 1:
 
-            self.ax = self.figure.add_subplot(1, 1, 1)
-
             plt.ion()  # Set interactive mode ON, so matplotlib will not be blocking the window
 
-            # meje osi
-            self.axes = plt.gca()
-            self.ax.set_autoscale_on(False)
-
-            self.x = []
-            self.y = []
+            self.renderer = LiveRenderer(self.figure, self.canvas)
 
-            self.ax.plot(self.x, self.y)
+            self.history = RingBuffer(LIVE_HISTORY)
 
             #plt.tight_layout()
 
             self.canvas.draw()
 
+            self.scheduler.start()
+
         elif self.draw_data == 0:
             pass
 
-    def change_value(self, value):
-
-        if self.step_mode_enable == 1 and self.one_step == 1 or self.step_mode_enable == 0:
+    def render_frame(self):
+        if self.draw_data == 0 or len(self.history) == 0:
+            return
 
-            if self.draw_data == 1 and self.pause == 0 and self.stoped == 0:
-                self.ax.clear()
+        if self.selector == 1:
+            self.renderer.set_mode('Trenutna ADC vrednost senzorja', (-0.4, 1020))
 
-                self.ax.set_title("Izris trenutne vrednosti")
-                self.ax.set_xlabel('Čas [h:m:s]')  # x os label
+        if self.selector == 2:
+            self.renderer.set_mode('Trenutna vrednost izhoda senzorja [1 = ON], [0 = OFF]', (-0.1, 1.1))
 
-                self.x.append(dt.now())
-                self.y.append(value)
+        stamps, values = self.history.view(self.lenght)
+        self.renderer.update(local_datenum(stamps), values)
 
-                background = self.figure.canvas.copy_from_bbox(self.ax.bbox)
+        self.steplineEdit.setText(str(values[-1]))
 
-                self.ax.plot(self.x, self.y)
-                self.ax.xaxis.set_major_formatter(md.DateFormatter('%H:%M:%S'))
-                for label in self.ax.xaxis.get_ticklabels():
-                    label.set_rotation(45)
+    def render_stats(self, fps, per_frame):
+        self.fps_label.setText("%.1f fps, %.1f vz./sliko" % (fps, per_frame))
 
-                if self.selector == 1:
-                    self.ax.set_ylabel('Trenutna ADC vrednost senzorja')  # y os label
-                    self.axes.set_ylim([-0.4, 1020])
+    def change_value(self, values, stamps):
 
-                if self.selector == 2:
-                    self.ax.set_ylabel('Trenutna vrednost izhoda senzorja [1 = ON], [0 = OFF]')  # y os label
-                    self.axes.set_ylim([-0.1, 1.1])
+        if self.step_mode_enable == 1 and self.one_step == 1 or self.step_mode_enable == 0:
 
-                if len(self.x) > self.lenght:
-                    del self.y[0]
-                    del self.x[0]
-                self.canvas.draw()
+            if self.step_mode_enable == 1:
+                # en korak = en vzorec
+                values = values[:1]
+                stamps = stamps[:1]
 
-                self.steplineEdit.clear()
-                self.steplineEdit.setText(str(value))
+            if self.draw_data == 1 and self.pause == 0 and self.stoped == 0:
+                self.history.extend(stamps, values)
+                self.scheduler.notify(len(values))
 
             if self.button_log == 1 and self.pause == 0 and self.stoped == 0:
                 if self.header_created == 0:
                     self.header_created = 1
 
-                    self.log_data.writelines(["#TITLE = " + "Izris trenutne vrednosti" + "\n"])
-                    self.log_data.writelines(["#X = " + "Cas [h:m:s]" + "\n"])
-
+                    y_label = None
                     if self.selector == 1:
-                        self.log_data.writelines(["#Y = " + "Trenutna ADC vrednost senzorja" + "\n"])
+                        y_label = "Trenutna ADC vrednost senzorja"
 
                     elif self.selector == 2:
-                        self.log_data.writelines(
-                            ["#Y = " + "Trenutna vrednost izhoda senzorja [1 = ON], [0 = OFF]" + "\n"])
+                        y_label = "Trenutna vrednost izhoda senzorja [1 = ON], [0 = OFF]"
 
-                    self.log_data.writelines(
-                        ["#------------------------------------------------------------------" + "\n"])
+                    self.log_writer.write_header("Izris trenutne vrednosti", "Cas [h:m:s]", y_label)
 
-                datum = dt.now()
-                self.log_data.writelines([datum.strftime(self.log_style) + self.log_vejica + str(value) + "\n"])
+                self.log_writer.put(values, stamps)
 
             else:
                 pass
@@ -1470,66 +5064,6 @@ class MplDrawGraph(QWidget):
                 self.one_step = 0
 
 
-class DrawThread(QThread):
-    draw_thread = pyqtSignal(int)
-
-    def __init__(self, port):
-        super(DrawThread, self).__init__()
-        self.kill_thread = 0
-        self.ser = serial.Serial(
-            port=port,
-            baudrate=9600,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            timeout=1)
-
-    def __del__(self):
-        pass
-
-    def closeEvent(self, event):
-        self.kill_thread = 1
-
-    def run(self):
-        while True:
-            if self.kill_thread == 0:
-                time.sleep(0.1)
-                s = self.ser.read(0)
-                line = self.ser.readline()
-
-                if line == b'0\x00\n':
-                    self.draw_thread.emit(0)
-
-                elif line == b'1\x00\n':
-                    self.draw_thread.emit(1)
-
-                elif len(line) == 10:
-                    line = line.strip()
-                    line = line.decode("utf-8")
-
-                    k = 1
-                    message = []
-                    for i in range(0, len(line)):
-                        if line[i] != '\x00':
-                            message.append(line[i])
-                            k += 1
-
-                    e = ""
-                    for i in range(0, len(message)):
-                        e += str(message[i])
-
-                    recived = int(e)
-
-                    self.draw_thread.emit(recived)
-
-                else:
-                    pass
-
-            elif self.kill_thread == 1:
-                self.ser.close()
-                time.sleep(0.4)
-                self.terminate()
-
 '''
 ----------   Log plotter   ----------
 '''
@@ -1545,10 +5079,16 @@ class MplLogPlotter(QWidget):
         self.draw_dots = 0 # izris dots 1: ON 0: OFF
         self.file_open = 0 # dokuent je odprt
         self.read_error = 1
+        self.error_text = ""
+        self.lod = None
+        self.binary = False
+        self.range_loaded = False
 
         self.draw_log_ui(self)
 
     def closeEvent(self, event):
+        self.follow_timer.stop()
+
         if self.file_open == 0:
             self.close
 
@@ -1630,6 +5170,43 @@ class MplLogPlotter(QWidget):
         self.pushButton.setIcon(QIcon('icons/open-folder.png'))
         self.horizontalLayout.addWidget(self.pushButton)
 
+        self.groupBox_2 = QGroupBox(MplLogPlotter)
+        self.groupBox_2.setGeometry(QRect(760, 0, 150, 50))
+        self.groupBox_2.setTitle("Follow:")
+
+        self.QCheckBox3 = QCheckBox(self.groupBox_2)
+        self.QCheckBox3.setGeometry(QRect(10, 25, 60, 20))
+        self.QCheckBox3.setText("follow")
+        self.QCheckBox3.setToolTip("Append new lines as the log grows")
+
+        self.follow_interval = QSpinBox(self.groupBox_2)
+        self.follow_interval.setGeometry(QRect(75, 25, 65, 20))
+        self.follow_interval.setRange(1, 3600)
+        self.follow_interval.setSuffix(" s")
+        self.follow_interval.setValue(LOG_FOLLOW_INTERVAL)
+        self.follow_interval.setToolTip("Poll interval")
+
+        self.groupBox_3 = QGroupBox(MplLogPlotter)
+        self.groupBox_3.setGeometry(QRect(915, 0, 420, 50))
+        self.groupBox_3.setTitle("Range:")
+
+        self.QCheckBox4 = QCheckBox(self.groupBox_3)
+        self.QCheckBox4.setGeometry(QRect(10, 25, 60, 20))
+        self.QCheckBox4.setText("range")
+        self.QCheckBox4.setToolTip("Open only the index, then load the selected time range")
+
+        self.from_edit = QDateTimeEdit(self.groupBox_3)
+        self.from_edit.setGeometry(QRect(70, 25, 140, 20))
+        self.from_edit.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+
+        self.to_edit = QDateTimeEdit(self.groupBox_3)
+        self.to_edit.setGeometry(QRect(215, 25, 140, 20))
+        self.to_edit.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+
+        self.range_button = QPushButton(self.groupBox_3)
+        self.range_button.setGeometry(QRect(360, 25, 50, 20))
+        self.range_button.setText("load")
+
         #self.horizontalSlider = QSlider(MplLogPlotter)
         #self.horizontalSlider.setGeometry(QRect(300, 930, 150, 30))
         #self.horizontalSlider.setOrientation(Qt.Horizontal)
@@ -1649,18 +5226,37 @@ class MplLogPlotter(QWidget):
 
         self.color_selector.clicked.connect(self.pick_color)
 
+        self.QCheckBox3.stateChanged.connect(self.follow_select)
+        self.range_button.clicked.connect(self.log_range_select)
+        self.follow_interval.valueChanged.connect(self.follow_interval_changed)
+
+        # sledenje logu: casovnik in opazovanje datoteke
+        self.follow_timer = QTimer(self)
+        self.follow_timer.timeout.connect(self.follow_update)
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.follow_update)
+
     def find_log_location(self):
-        location = QFileDialog.getOpenFileName(self, "Open log file", "", "Text files (*.txt *.log)")
+        location = QFileDialog.getOpenFileName(self, "Open log file", "", "Log files (*.txt *.log *.bin)")
 
         if location != ('', ''):
-            log_location = ''.join(location) # convert tuple to string
-            self.log_location = log_location.replace("Text files (*.txt *.log)", "")
+            self.log_location = location[0]
 
             self.lineEdit.setText(self.log_location)
             self.lineEdit.setReadOnly(True)
 
+            if self.QCheckBox4.isChecked():
+                # samo indeks, podatke nalozimo z "load"
+                self.log_span()
+                return
+
             self.log_file_data()
             self.log_file_init_figure()
+            self.follow_select()
+
+            if self.read_error == 0 and len(self.xi):
+                self.set_span(self.xi[0], self.xi[-1])
 
     def log_location_is(self, file):
         self.log_location = file
@@ -1690,139 +5286,210 @@ class MplLogPlotter(QWidget):
         self.log_file_init_figure()
 
     def log_file_data(self):
-        self.log_data = open(self.log_location, 'r').read()
+        self.range_loaded = False
+
+        try:
+            if is_binary_log(self.log_location):
+                self.binary_file_data()
+                return
+
+            # zadnja vrstica brez "\n" se morda se pise, zato je ne beremo
+            meta, self.xi, self.ys, self.layout, self.offset = log_cache.load(self.log_location,
+                                                                              log_progress(self, "Loading log..."))
+            self.binary = False
+
+        except LogReadCancelled:
+            self.read_error = 2 # preklicano, brez sporocila
+            return
+
+        except (OSError, ValueError) as error:
+            self.error_text = str(error)
+            self.read_error = 1
+            return
+
         self.file_open = 1
 
-        lines = []
-        lines = self.log_data.split('\n')
+        self.title = meta["title"]
+        self.x_label = meta["x"]
+        self.y_label = meta["y"]
+
+        self.build_lod()
+        self.read_error = 0
+
+    def set_span(self, first, last):
+        first = str(np.datetime64(first, 's'))
+        last = str(np.datetime64(last, 's') + np.timedelta64(1, 's'))
+
+        self.from_edit.setDateTime(QDateTime.fromString(first, "yyyy-MM-ddTHH:mm:ss"))
+        self.to_edit.setDateTime(QDateTime.fromString(last, "yyyy-MM-ddTHH:mm:ss"))
+
+    def log_span(self):
+        try:
+            first, last = log_time_span(self.log_location)
+
+        except (OSError, ValueError) as error:
+            self.error_text = str(error)
+            self.error_message()
+            return
+
+        if first is not None:
+            self.set_span(first, last)
+
+    def log_range_select(self):
+        t0 = np.datetime64(self.from_edit.dateTime().toString("yyyy-MM-ddTHH:mm:ss"))
+        t1 = np.datetime64(self.to_edit.dateTime().toString("yyyy-MM-ddTHH:mm:ss"))
 
-        header = []
+        try:
+            meta = read_log_meta(self.log_location)
+            self.xi, self.ys = load_log_range(self.log_location, t0, t1)
+
+        except (OSError, ValueError) as error:
+            self.error_text = str(error)
+            self.read_error = 1
+            self.log_file_init_figure()
+            return
+
+        # sledenje velja samo za cel log
+        self.range_loaded = True
+        self.QCheckBox3.setChecked(False)
+        self.file_open = 1
+
+        self.title = meta["title"]
+        self.x_label = meta["x"]
+        self.y_label = meta["y"]
+
+        self.build_lod()
+        self.read_error = 0
+        self.log_file_init_figure()
 
-        xs = []
-        self.ys = []
+    def follow_select(self):
+        for path in self.watcher.files():
+            self.watcher.removePath(path)
 
-        for line in range(0, len(lines)):
-            if line < 3:
-                header.append(lines[line])
+        if self.QCheckBox3.isChecked() and self.read_error == 0 and not self.range_loaded:
+            # za sprotno dodajanje prepisemo podatke v rastoca polja
+            self.times_buffer = GrowableArray(self.xi.dtype, max(len(self.xi), 4096))
+            self.values_buffer = GrowableArray(self.ys.dtype, max(len(self.ys), 4096))
+            self.times_buffer.extend(self.xi)
+            self.values_buffer.extend(self.ys)
 
-            elif line > 3:
-                if lines[line] not in ("", " "):
+            self.watcher.addPath(self.log_location)
+            self.follow_timer.start(self.follow_interval.value() * 1000)
 
-                    x, y = lines[line].split(",")
+        else:
+            self.follow_timer.stop()
 
-                    # odstranimo presledke iz vrednosti
-                    y = y.strip(" ")
+    def follow_interval_changed(self, interval):
+        if self.follow_timer.isActive():
+            self.follow_timer.start(interval * 1000)
 
-                    xs.append(x)
-                    self.ys.append(y)
+    def follow_update(self):
+        if self.read_error != 0:
+            return
 
-                elif lines[line] == " ":
-                    pass
+        # datoteka je bila zamenjana, opazujemo jo znova
+        if self.log_location not in self.watcher.files() and os.path.exists(self.log_location):
+            self.watcher.addPath(self.log_location)
 
-        # log file header
-        for n in range(0, len(header)):
-            read_line = header[n]
+        try:
+            if self.binary:
+                count = self.follow_binary()
 
-            if read_line[0:9] == "#TITLE = ":
-                self.title = read_line[9:len(read_line)]
+            else:
+                count = self.follow_text()
 
-            elif read_line[0:5] == "#X = ":
-                self.x_label = read_line[5:len(read_line)]
+        except (OSError, ValueError) as error:
+            self.follow_timer.stop()
+            self.QCheckBox3.setChecked(False)
+            self.error_text = str(error)
+            self.error_message()
+            return
 
-            elif read_line[0:5] == "#Y = ":
-                self.y_label = read_line[5:len(read_line)]
+        if count is None:
+            # skrajsana ali prepisana datoteka, beremo znova
+            self.log_file_data()
+            self.log_file_init_figure()
+            self.follow_select()
 
+        elif count:
+            self.follow_plot(len(self.xi) - count)
 
-        # log file data
-        slot = np.chararray((len(xs), 12), itemsize=5)
-        slot[:] = '0'
+    def follow_text(self):
+        if os.path.getsize(self.log_location) < self.offset:
+            return None
 
-        xsss = []
-        for i in range(0, len(xs)):
-            xss = xs[i]
-            # print(xss)
+        start = len(self.times_buffer)
 
-            a = ''
-            b = 0
-            for j in range(0, len(xss)):
-                if xss[j] not in ('-', ':', ' '):
-                    a += xss[j]
+        # samo cele vrstice; nedokoncano preberemo ob naslednjem tiku
+        meta, self.layout, times, values, self.offset = parse_text_log(self.log_location, start=self.offset,
+                                                                       layout=self.layout, partial=False)
+        self.times_buffer.extend(times)
+        self.values_buffer.extend(values)
 
-                elif xss[j] in ('-', ':', ' '):
-                    slot[i, b] = a
-                    b += 1
+        self.xi = self.times_buffer.view()
+        self.ys = self.values_buffer.view()
 
-                    if j != (len(xss)):
-                        slot[i, b] = xss[j]
-                        b += 1
-                        a = ''
+        return len(self.xi) - start
 
-                    # ce je zadnji char ' ' ga odstranimo:
-                    if xss[j] == ' ' and j == len(xss) - 1:
-                        xss = xss[:-1]
+    def follow_binary(self):
+        meta, records = open_binary_log(self.log_location)
 
-            xsss.append(xss)
+        if len(records) < len(self.xi):
+            return None
 
-        # Testne tocke [1],[3],[5]
-        a = 0
-        column_a = []
-        for k in range(0, len(slot)):
-            column_a.append(slot[k, 1])
+        count = len(records) - len(self.xi)
 
-            if k > 0:
-                if column_a[0] != column_a[k]:
-                    a += 1
+        self.xi = records['t'].view('M8[ns]')
+        self.ys = records['v']
 
-        b = 0
-        column_b = []
-        for k in range(0, len(slot)):
-            column_b.append(slot[k, 3])
+        return count
 
-            if k > 0:
-                if column_b[0] != column_b[k]:
-                    b += 1
+    def follow_plot(self, start):
+        if self.lod is None or start == 0 or self.xi[start] < self.xi[start - 1] \
+                or not LodPyramid.is_sorted(self.xi[start:]):
+            self.build_lod()
+            self.log_file_init_figure()
+            return
 
-        c = 0
-        column_c = []
-        for k in range(0, len(slot)):
-            column_c.append(slot[k, 5])
+        end = times_datenum(self.xi[start - 1:start])[0]
+        self.lod.update(self.xi, self.ys, start)
 
-            if k > 0:
-                if column_c[0] != column_c[k]:
-                    c += 1
+        low, high = self.ax.get_xlim()
 
-        if a == 0 and b == 0 and c == 0:
-            self.read_error = 0
+        if high >= end:
+            # desni rob sledi novim podatkom
+            shift = times_datenum(self.xi[-1:])[0] - end
+            self.ax.set_xlim(low + shift, high + shift)
 
         else:
-            self.read_error = 1
+            self.lod_update(self.ax)
 
-        if column_a[5] == b'-':
-            if column_b[5] == b'-':
-                if column_c[5] == '':
-                    self.log_style = "%Y-%d-%m %H:%M:%S "
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+        self.canvas.draw_idle()
 
-                elif column_c[5] == b':':
-                    self.log_style = "%d-%m-%H:%M:%S"
+    def binary_file_data(self):
+        meta, records = open_binary_log(self.log_location)
+        self.file_open = 1
 
-            elif column_b[5] == b':':
-                self.log_style = "%d-%m %H:%M:%S"
+        self.title = meta["title"]
+        self.x_label = meta["x"]
+        self.y_label = meta["y"]
 
-        elif column_a[5] == b':':
-            if column_b[5] == b':':
-                if column_c[5] == '':
-                    self.log_style = "%H:%M:%S"
+        # pogledi v memmap, brez razclenjevanja
+        self.binary = True
+        self.xi = records['t'].view('M8[ns]')
+        self.ys = records['v']
 
-                elif column_c[5] == '':
-                    self.log_style = "%H:%M:%S"
+        self.build_lod()
+        self.read_error = 0
 
-        elif column_a[5] not in (b':', b'-'):
-            self.log_style = "H%M%S"
+    def build_lod(self):
+        if len(self.xi) and LodPyramid.is_sorted(self.xi):
+            self.lod = LodPyramid(self.xi, self.ys)
 
-        self.xi = []
-        for i in range(0, len(xs)):
-            xd = dt.strptime(xs[i], self.log_style)
-            self.xi.append(xd)
+        else:
+            self.lod = None
 
     def error_message(self):
         self.msg = QMessageBox()
@@ -1830,44 +5497,65 @@ class MplLogPlotter(QWidget):
 
         self.msg.setWindowTitle("Error message")
         self.msg.setText("Can't read log file!")
-        # self.msg.setDetailedText("feee")
-        self.msg.setStandardButtons(QMessageBox.Ok | QMessageBox.Cancel)
-        self.msg.buttonClicked.connect(self.exit_msg)
+        self.msg.setDetailedText(self.error_text)
+        self.msg.setStandardButtons(QMessageBox.Ok)
+        self.msg.exec_()
 
     def log_file_init_figure(self):
         if self.read_error == 0:
-            # print(self.xi)
-            # print(self.ys)
-
+            self.figure.clear()
             self.ax = self.figure.add_subplot(1, 1, 1)
             plt.ion()  # Set interactive mode ON, so matplotlib will not be blocking the window
 
             # meje osi
             self.axes = plt.gca()
 
-            self.ax.clear()
+            if self.lod is None:
+                # prazen ali neurejen log, risemo vse tocke
+                x = times_datenum(self.xi)
+                y = self.ys
+            else:
+                x, y = self.lod_window(times_datenum(self.xi[:1])[0], times_datenum(self.xi[-1:])[0])
 
             if self.draw_line == 1 and self.draw_dots == 0:
-                self.ax.plot(self.xi, self.ys, color=self.color.name())
+                self.line, = self.ax.plot(x, y, color=self.color.name())
 
             elif self.draw_line == 0 and self.draw_dots == 1:
-                self.ax.plot(self.xi, self.ys, 'o', color=self.color.name(), marker='.')
+                self.line, = self.ax.plot(x, y, 'o', color=self.color.name(), marker='.')
 
             elif self.draw_line == 1 and self.draw_dots == 1:
-                self.ax.plot(self.xi, self.ys, color=self.color.name(), marker='.')
+                self.line, = self.ax.plot(x, y, color=self.color.name(), marker='.')
+
+            else:
+                self.line, = self.ax.plot(x, y, linestyle='None')
 
             self.ax.set_title(self.title)
             self.ax.set_xlabel(self.x_label)
             self.ax.set_ylabel(self.y_label)
 
+            self.ax.xaxis_date()
             self.ax.xaxis.set_major_formatter(md.DateFormatter('%H:%M:%S'))
             for label in self.ax.xaxis.get_ticklabels():
                 label.set_rotation(45)
 
+            if self.lod is not None:
+                self.ax.callbacks.connect('xlim_changed', self.lod_update)
+
             self.canvas.draw()
 
         elif self.read_error == 1:
-            self.error_message
+            self.error_message()
+
+    def lod_window(self, start, end):
+        pixels = max(int(self.ax.get_window_extent().width), 100)
+        times, values = self.lod.window(datenum_times(start, self.xi.dtype), datenum_times(end, self.xi.dtype), pixels)
+
+        return times_datenum(times), values
+
+    def lod_update(self, ax):
+        # ob zoom/pan izberemo nivo piramide, ki ustreza vidnemu obmocju
+        self.line.set_data(*self.lod_window(*ax.get_xlim()))
+        self.canvas.draw_idle()
 
 '''
 ----------   Log editor   ----------
@@ -2059,46 +5747,67 @@ class MplLogEditor(QWidget):
             pass
 
     def open_file(self):
-        location = open(self.log_location, 'r')
-
-        data = location.read()
-
         self.file_open = 1
 
         self.text_editor.clear()
 
-        lines = []
-        lines = data.split('\n')
+        progress = log_progress(self, "Loading log...")
+        line = 0
 
-        for line in range(0, len(lines)):
-            read_line = lines[line]
+        # datoteko beremo po kosih, v urejevalnik dodajamo cel kos naenkrat
+        for lines, position, size in iter_log_lines(self.log_location):
+            block = []
 
-            if line < 3:
-                if read_line[0:9] == "#TITLE = ":
-                    self.title = read_line[9:len(read_line)]
+            for read_line in lines:
+                read_line = read_line.decode('utf8', 'replace')
 
-                    self.lineEdit_3.setText(self.title)
-                    self.QCheckBox1.setChecked(True)
+                if line < 3:
+                    if read_line[0:9] == "#TITLE = ":
+                        self.title = read_line[9:len(read_line)]
 
-                elif read_line[0:5] == "#X = ":
-                    self.x_label = read_line[5:len(read_line)]
+                        self.lineEdit_3.setText(self.title)
+                        self.QCheckBox1.setChecked(True)
 
-                    self.lineEdit_2.setText(self.x_label)
-                    self.QCheckBox1.setChecked(True)
+                    elif read_line[0:5] == "#X = ":
+                        self.x_label = read_line[5:len(read_line)]
 
-                elif read_line[0:5] == "#Y = ":
-                    self.y_label = read_line[5:len(read_line)]
+                        self.lineEdit_2.setText(self.x_label)
+                        self.QCheckBox1.setChecked(True)
 
-                    self.lineEdit_4.setText(self.y_label)
-                    self.QCheckBox1.setChecked(True)
+                    elif read_line[0:5] == "#Y = ":
+                        self.y_label = read_line[5:len(read_line)]
 
-                else:
-                    self.text_editor.append(read_line)
+                        self.lineEdit_4.setText(self.y_label)
+                        self.QCheckBox1.setChecked(True)
+
+                    else:
+                        block.append(read_line)
+
+                elif line > 3:
+                    block.append(read_line)
 
-            elif line > 3:
-                self.text_editor.append(read_line)
+                line += 1
+
+            if block:
+                self.text_editor.append("\n".join(block))
+
+            if not progress(position, size):
+                self.cancel_open()
+                return
+
+    def cancel_open(self):
+        # delno nalozenega loga ne smemo shraniti cez original
+        self.file_open = 0
+        self.text_editor.clear()
+
+        self.log_location = ""
+        self.lineEdit_1.clear()
+
+        for edit in (self.lineEdit_3, self.lineEdit_2, self.lineEdit_4):
+            edit.clear()
+        self.QCheckBox1.setChecked(False)
 
-        location.close()
+        QMessageBox.information(self, "Log file editor", "Loading cancelled, nothing was loaded.", QMessageBox.Ok)
 
     def save_file(self):
         location = QFileDialog.getSaveFileName(self, "Save log file", self.log_location, "Text files (*.txt *.log)")